@@ -8,7 +8,15 @@ from semantic_version import Version, Spec
 
 from .pyitect import System
 from .pyitect import Plugin
+from .pyitect import MemoryPlugin
+from .pyitect import Catalogue
 from .pyitect import Component
+from .pyitect import ComponentHandle
+from .pyitect import ComponentMap
+from .pyitect import CompactComponentMap
+from .pyitect import ComponentStats
+from .pyitect import InstrumentedComponent
+from .pyitect import LoadGraph
 
 from .pyitect import get_system
 from .pyitect import build_system
@@ -24,6 +32,17 @@ from .pyitect import PyitectNotProvidedError
 from .pyitect import PyitectNotMetError
 from .pyitect import PyitectLoadError
 from .pyitect import PyitectOnEnableError
+from .pyitect import PyitectCycleError
 from .pyitect import PyitectDupError
+from .pyitect import PyitectBudgetWarning
+
+from .workers import ProcessHost
+from .workers import RemoteComponent
+
+from .repository import Repository
+
+from .tracing import Tracer
+from .tracing import NullTracer
+from .tracing import ChromeTracer
 
 from . import imports
@@ -1,5 +1,18 @@
 """
 This is the shadow module used as a namespace for
 providing component to loading plugins during import
+
+On Python 3.7+ the components are looked up on demand through the module's
+`__getattr__`, scoped to the plugin doing the import. So a plugin only ever
+sees the components it consumes and, when its system loads imports lazily,
+only the components it actually imports get loaded.
 """
-# This is a blank file it servs meerly as a placeholder to create teh namespace
+# Keep the namespace blank, every name here would hide a component
+import sys as _sys
+
+
+def __getattr__(name):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    from .pyitect import _import_lookup
+    return _import_lookup(name, _sys._getframe(1))
@@ -4,13 +4,40 @@ import sys
 import os
 import traceback
 import re
+import weakref
+import threading
+import fnmatch
+import functools
+import inspect
+import bisect
+import array
+import warnings
+import types
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# the collection ABCs moved to collections.abc in Python 3.3
+try:
+    from collections.abc import Mapping, Iterable
+except ImportError:
+    from collections import Mapping, Iterable
+
+from .tracing import NullTracer
 
 PY_VER = sys.version_info[:2]
 PY2 = PY_VER[0] == 2
 have_importlib = PY_VER >= (3, 4)
+# module_from_spec and exec_module replace load_module in Python 3.5+
+have_exec_module = PY_VER >= (3, 5)
+# module level __getattr__ (PEP 562) lets pyitect.imports resolve on demand
+have_module_getattr = PY_VER >= (3, 7)
 
 if have_importlib:
     import importlib.util
+    import importlib.machinery
 else:
     import imp
 
@@ -27,6 +54,12 @@ try:
 except NameError:
     basestring = str
 
+# perf_counter is Python 3.3+
+try:
+    from time import perf_counter as _clock
+except ImportError:
+    from time import time as _clock
+
 _have_yaml = False
 try:
     import yaml
@@ -34,8 +67,36 @@ try:
 except ImportError:
     pass
 
+# memory accounting needs tracemalloc which is only in Python 3.4+
+_have_tracemalloc = False
+try:
+    import tracemalloc
+    _have_tracemalloc = True
+except ImportError:
+    pass
+
 _system = None
 
+# the values of the `load` hints in plugin configs
+LOAD_HINTS = ("eager", "lazy", "idle")
+
+# how many plugin imports lazy loads can nest before the dependencies of
+# the next plugin are loaded before it, keeping the python stack shallow
+_MAX_NESTED_LOADS = 8
+
+# plugin modules keep the _ImportScope pyitect.imports looks their consumed
+# components up in as this global, so each system's copy of a plugin module
+# has it's own
+_SCOPE_ATTR = "__pyitect_scope__"
+# per thread stack of the scopes of the plugins being imported
+_import_local = threading.local()
+# per thread stack of the folders of the plugins being executed,
+# _PluginFinder finds sibling modules in the top one
+_plugin_dir_local = threading.local()
+_plugin_finder = None
+# marks the threads importing prefetched plugins
+_prefetch_local = threading.local()
+
 
 def get_system():
     """Fetch the global system instance
@@ -50,12 +111,13 @@ def get_system():
         raise PyitectError("Global system instance not built yet")
 
 
-def build_system(config, enable_yaml=False):
+def build_system(config, enable_yaml=False, **kwargs):
     """Build a global system instance
 
     Args:
         config (dict): A mapping of component names to version requirements
         enable_yaml (bool): Should the system support yaml config files?
+        **kwargs: any other keyword arguments are passed on to :class:`System`
 
     Raises:
         PyitectError: if the system is already built
@@ -63,17 +125,19 @@ def build_system(config, enable_yaml=False):
     global _system
     if _system:
         raise PyitectError("Global system instance already exists")
-    _system = System(config, enable_yaml)
+    _system = System(config, enable_yaml, **kwargs)
     return _system
 
 
 def destroy_system():
     """destroy the global system instance
 
-    does nothing if the system isn't built
+    closes the system, releasing everything it loaded, see
+    :meth:`System.close`. does nothing if the system isn't built
     """
     global _system
     if _system:
+        _system.close()
         _system = None
 
 
@@ -92,7 +156,12 @@ class Plugin(object):
         version (Version): plugin vesion
         file (str): relative path to the file to import to load the plugin
         consumes (dict): a listing of the components consumed
-        provides (dict): a listing of the components provided
+        provides (dict): a listing of the components provided, mapping the
+            component names to their paths in the module
+        load_hint (None, str): when the plugin's components should be
+            loaded, `"eager"`, `"lazy"` or `"idle"`, `None` if not given
+        load_hints (dict): names of components with their own load hint
+            mapped to it
         on_enable (None, str): either `None` or a str doted name of a function
             in the module
         path (str): an absolute path to the plugin folder
@@ -139,19 +208,33 @@ class Plugin(object):
                 "Plugin as '%s' does not have a plugin file spesified"
                 % (path,))
         if (('consumes' in config) and
-                isinstance(config['consumes'], collections.Mapping)):
+                isinstance(config['consumes'], Mapping)):
             self.consumes = config['consumes']
         else:
             raise ValueError(
                 "Plugin at '%s' has no map of consumed "
                 "components to plugin versions" % (path,))
         if (('provides' in config) and
-                isinstance(config['provides'], collections.Mapping)):
-            self.provides = config['provides']
+                isinstance(config['provides'], Mapping)):
+            self.provides = {}
+            self.load_hints = {}
+            for name, provided in config['provides'].items():
+                if isinstance(provided, Mapping):
+                    # {"path": "<path>", "load": "<hint>"}
+                    self.provides[name] = provided.get('path', '')
+                    if 'load' in provided:
+                        self.load_hints[name] = _check_load_hint(
+                            provided['load'], path)
+                else:
+                    self.provides[name] = provided
         else:
             raise ValueError(
                 "Plugin at '%s' hs no map of provided components"
                 " to version postfixes" % (path,))
+        if 'load' in config:
+            self.load_hint = _check_load_hint(config['load'], path)
+        else:
+            self.load_hint = None
         if 'on_enable' in config:
             if isinstance(config['on_enable'], basestring):
                 self.on_enable = config['on_enable']
@@ -172,20 +255,27 @@ class Plugin(object):
         """
         return (self.name, self.author, self.version, self.path)
 
-    def _load(self):
+    def _load(self, module_name=None):
         global PY2
         # import can handle cases where the file isn't a python source file,
         # for example a compiled pyhton module in the form of a .pyd or .so
         # only works with pyhton 3.4+
         filepath = os.path.join(self.path, self.file)
-        module_name = get_unique_name(self.author, self.get_version_string())
-        if have_importlib:
+        if module_name is None:
+            module_name = self.get_module_name()
+        if have_exec_module:
+            plugin = self._exec_module(module_name, filepath)
+        elif have_importlib:
             try:
                 sys.path.insert(0, self.path)
-                spec = importlib.util.spec_from_file_location(
-                    module_name, filepath)
-                plugin = spec.loader.load_module()
-                sys.path.remove(self.path)
+                try:
+                    spec = importlib.util.spec_from_file_location(
+                        module_name, filepath)
+                    plugin = spec.loader.load_module()
+                finally:
+                    sys.path.remove(self.path)
+            except PyitectCycleError:
+                raise
             except Exception as err:
                 raise PyitectLoadError(
                     "Plugin '%s' at '%s' failed to load"
@@ -202,6 +292,8 @@ class Plugin(object):
                 f, pathn, desc = imp.find_module(name, [search_path])
                 try:
                     plugin = imp.load_module(module_name, f, pathn, desc)
+                except PyitectCycleError:
+                    raise
                 except Exception as err:
                     raise PyitectLoadError(
                         "Plugin '%s' at '%s' failed to load"
@@ -210,7 +302,9 @@ class Plugin(object):
                 finally:
                     if f:
                         f.close()
-                sys.path.remove(search_path)
+                    sys.path.remove(search_path)
+            except PyitectLoadError:
+                raise
             except Exception as err:
                 raise PyitectLoadError(
                     "Plugin '%s' at '%s' failed to load"
@@ -219,6 +313,41 @@ class Plugin(object):
 
         return plugin
 
+    def _exec_module(self, module_name, filepath):
+        """Import the plugin with `module_from_spec` and `exec_module`
+
+        `sys.path` is left alone, while the module executes top level
+        imports of modules beside it are found by :class:`_PluginFinder`.
+        a failed import is removed from `sys.modules` again
+        """
+        _install_plugin_finder()
+        try:
+            spec = importlib.util.spec_from_file_location(
+                module_name, filepath)
+            if spec is None:
+                raise ImportError(
+                    "No loader for plugin file '%s'" % (filepath,))
+            module = importlib.util.module_from_spec(spec)
+            setattr(module, _SCOPE_ATTR, _top_import_scope())
+            sys.modules[module_name] = module
+            if not hasattr(_plugin_dir_local, "dirs"):
+                _plugin_dir_local.dirs = []
+            _plugin_dir_local.dirs.append(self.path)
+            try:
+                spec.loader.exec_module(module)
+            finally:
+                _plugin_dir_local.dirs.pop()
+        except Exception as err:
+            _drop_modules(module_name, self.path)
+            if isinstance(err, PyitectCycleError):
+                raise
+            raise PyitectLoadError(
+                "Plugin '%s' at '%s' failed to load"
+                % (self.name, self.path),
+                cause=err)
+        # the module may have replaced it's entry like any import
+        return sys.modules.get(module_name, module)
+
     def load(self):
         """loads the plugin file and returns the resulting module
 
@@ -231,13 +360,39 @@ class Plugin(object):
             self.module = plugin
         return self.module
 
+    def unload(self):
+        """forget the loaded module
+
+        removes the module, any submodules of a package plugin and the
+        modules it imported from beside it in the plugin folder from
+        `sys.modules` so they can be freed. the next :meth:`load`
+        imports the plugin again
+        """
+        if self.module is None:
+            return
+        _drop_modules(self.module.__name__, self.path)
+        self.module = None
+
+    def get_load_hint(self, component):
+        """returns the load hint of a provided component, `None` if the
+        component and the plugin don't give one"""
+        return self.load_hints.get(component, self.load_hint)
+
     def get_version_string(self):
         """returns a version string"""
         return self.name + ":" + str(self.version)
 
-    def run_on_enable(self):
+    def get_module_name(self):
+        """returns the unique name the plugin module is imported under"""
+        return get_unique_name(self.author, self.get_version_string())
+
+    def run_on_enable(self, module=None):
         """runs the function in the 'on_enable' if set
 
+        Args:
+            module (None, object): the module to find the function in,
+                defaults to the plugin's own module
+
         Raises:
             TypeError: if the on_enable property is set wrong
 
@@ -254,12 +409,14 @@ class Plugin(object):
                     "in its on_enable"
                     % (self.name, self.path))
             parts = self.on_enable.split(".")
-            if self.module is None:
+            if module is None:
+                module = self.module
+            if module is None:
                 raise PyitectLoadError(
                     "Plugin '%s' at '%s': has no module object and is not "
                     "loaded yet. can not attempt to find on_enable function"
                     % (self.name, self.path))
-            obj = self.module
+            obj = module
             try:
                 for part in parts:
                     obj = getattr(obj, part)
@@ -291,6 +448,12 @@ class Plugin(object):
         """returns `True` if it has an `on_enable` attribute that's not None"""
         return (self.on_enable is not None) and (not self.on_enable == "")
 
+    def __getstate__(self):
+        # module objects can't be pickled, a unpickled plugin is not loaded
+        state = self.__dict__.copy()
+        state["module"] = None
+        return state
+
     def __str__(self):
         return self.get_version_string()
 
@@ -308,6 +471,90 @@ class Plugin(object):
         return hash(self.key())
 
 
+class MemoryPlugin(Plugin):
+    """A plugin built in memory instead of found in a folder
+
+    the plugin's module is either an already created module object or
+    python source code. nothing is run when the plugin is registered, the
+    source is run in a new module when the plugin is loaded, like a plugin
+    file, so it can import it's consumed components from
+    :mod:`pyitect.imports`. a module object was imported already, it's
+    consumed components are loaded before it is used unless the system has
+    `lazy_imports`, then they are loaded when it's functions import them.
+    only source plugins can be hosted in worker processes
+
+    Attributes:
+        source (None, str): the plugin's source code
+    """
+
+    def __init__(self, config, module=None, source=None):
+        """Init the plugin from a config mapping
+
+        the config is the same as a plugin config file's but the `file`
+        key is optional
+
+        Args:
+            config (dict): a mapping object like a plugin config file
+            module (None, object): the plugin's module object
+            source (None, str): source code of the plugin's module
+
+        Raises:
+            ValueError: when any of the config keys are wrong or not exactly
+                one of `module` and `source` is given
+        """
+        path = "<memory:%s>" % (config.get('name', ''),)
+        if (module is None) == (source is None):
+            raise ValueError(
+                "Plugin at '%s' needs either a module or source" % (path,))
+        if source is not None and not isinstance(source, basestring):
+            raise ValueError(
+                "Plugin at '%s' has source that is not a string" % (path,))
+        if 'file' not in config:
+            config = dict(config)
+            config['file'] = ''
+        super(MemoryPlugin, self).__init__(config, path)
+        self.source = source
+        self._module = module
+
+    def _load(self, module_name=None):
+        if self._module is not None:
+            return self._module
+        if module_name is None:
+            module_name = self.get_module_name()
+        module = types.ModuleType(module_name)
+        setattr(module, _SCOPE_ATTR, _top_import_scope())
+        sys.modules[module_name] = module
+        try:
+            code = compile(self.source, self.path, "exec")
+            exec(code, module.__dict__)
+        except Exception as err:
+            sys.modules.pop(module_name, None)
+            if isinstance(err, PyitectCycleError):
+                raise
+            raise PyitectLoadError(
+                "Plugin '%s' at '%s' failed to load"
+                % (self.name, self.path),
+                cause=err)
+        return sys.modules.get(module_name, module)
+
+    def unload(self):
+        """forget the loaded module
+
+        a module object the plugin was given is left in `sys.modules`
+        """
+        if self._module is not None:
+            self.module = None
+        else:
+            super(MemoryPlugin, self).unload()
+
+    def get_module_name(self):
+        """returns the name the plugin module is imported under, the
+        module's own name if it was given one"""
+        if self._module is not None:
+            return self._module.__name__
+        return super(MemoryPlugin, self).get_module_name()
+
+
 class Component(object):
     """An object to hold metadata for a spesfic instance of a component
 
@@ -352,6 +599,17 @@ class Component(object):
         self.version = version
         self.path = path
 
+    @classmethod
+    def _trusted(cls, name, plugin, author, version, path):
+        """Build a component from already checked values"""
+        component = cls.__new__(cls)
+        component.name = name
+        component.author = author
+        component.plugin = plugin
+        component.version = version
+        component.path = path
+        return component
+
     def key(self):
         """returns a key to identify this component
 
@@ -371,6 +629,749 @@ class Component(object):
         return hash(self.key())
 
 
+class ComponentMap(dict):
+    """The default registry of the components a system knows about
+
+    a mapping of component names to mappings of plugin names to mappings
+    of versions to :class:`Component` objects,
+    `component_map[name][plugin][version]`.
+
+    the system only goes through the methods below, so any object
+    providing them and `in`, `len` and iteration over the component names
+    can be used as a registry, see :class:`CompactComponentMap`.
+    :meth:`remove` is only used to roll back a failed bulk enable
+    """
+
+    def add(self, component):
+        """Add a component
+
+        Raises:
+            PyitectDupError: if the plugin version already provides it
+        """
+        name = component.name
+        # ensure a place to list component providing plugin versions
+        if name not in self:
+            self[name] = {}
+        if component.plugin not in self[name]:
+            self[name][component.plugin] = {}
+        if component.version in self[name][component.plugin]:
+            raise PyitectDupError(
+                "Duplicate component %s provided by plugin %s@%s"
+                % (name, component.plugin, component.version))
+        self[name][component.plugin][component.version] = component
+
+    def remove(self, component):
+        """Remove a component, if it's in the map"""
+        name = component.name
+        versions = self.get(name, {}).get(component.plugin)
+        if versions is None or component.version not in versions:
+            return
+        del versions[component.version]
+        if not versions:
+            del self[name][component.plugin]
+        if not self[name]:
+            del self[name]
+
+    def get_component(self, name, plugin, version):
+        """returns the :class:`Component` or `None` if it isn't provided"""
+        try:
+            return self[name][plugin][version]
+        except KeyError:
+            return None
+
+    def plugin_names(self, name):
+        """returns a list of the names of the plugins providing a component"""
+        return list(self.get(name, ()))
+
+    def versions(self, name, plugin):
+        """returns a list of the versions of a plugin providing a component"""
+        if name not in self or plugin not in self[name]:
+            return []
+        return list(self[name][plugin])
+
+
+class CompactComponentMap(object):
+    """A component registry for very large catalogues
+
+    strings are interned to integer ids and the components are stored as
+    rows of `array` columns, `(name, plugin, author, version, path)` ids.
+    :class:`Component` objects are only built when they are asked for.
+    the rows of each component name are kept sorted by plugin and version
+    so they can be searched with :mod:`bisect`.
+    works as a :class:`ComponentMap`, indexing it with a component name
+    builds the nested mapping of that component's providers
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Remove all of the components"""
+        self._strings = []
+        self._string_ids = {}
+        self._versions = []
+        self._version_ids = {}
+        self._names = array.array("i")
+        self._plugins = array.array("i")
+        self._authors = array.array("i")
+        self._vers = array.array("i")
+        self._paths = array.array("i")
+        # name ids mapped to arrays of their rows and the plugin and
+        # version ids of those rows, sorted by plugin then version id
+        self._rows = {}
+        self._row_plugins = {}
+        self._row_vers = {}
+        # name ids mapped to lists of their plugin names, built on demand
+        self._plugin_names = {}
+
+    def _intern(self, string):
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(string)
+            self._string_ids[string] = string_id
+        return string_id
+
+    def _intern_version(self, version):
+        version_id = self._version_ids.get(version)
+        if version_id is None:
+            version_id = len(self._versions)
+            self._versions.append(version)
+            self._version_ids[version] = version_id
+        return version_id
+
+    def _plugin_range(self, name_id, plugin_id):
+        """returns the `(start, end)` of a plugin's rows of a name"""
+        plugins = self._row_plugins[name_id]
+        start = bisect.bisect_left(plugins, plugin_id)
+        return start, bisect.bisect_right(plugins, plugin_id, start)
+
+    def _index(self, name_id, plugin_id, version_id):
+        """returns the index a component has, or would have, in the
+        sorted rows of it's name"""
+        start, end = self._plugin_range(name_id, plugin_id)
+        return bisect.bisect_left(
+            self._row_vers[name_id], version_id, start, end)
+
+    def _has_index(self, name_id, plugin_id, version_id, index):
+        return (index < len(self._rows[name_id])
+                and self._row_plugins[name_id][index] == plugin_id
+                and self._row_vers[name_id][index] == version_id)
+
+    def _find(self, name, plugin, version):
+        """returns the row of a component or `None`"""
+        name_id = self._string_ids.get(name)
+        plugin_id = self._string_ids.get(plugin)
+        version_id = self._version_ids.get(version)
+        if (name_id not in self._rows or plugin_id is None
+                or version_id is None):
+            return None
+        index = self._index(name_id, plugin_id, version_id)
+        if not self._has_index(name_id, plugin_id, version_id, index):
+            return None
+        return self._rows[name_id][index]
+
+    def _component(self, row):
+        strings = self._strings
+        return Component(
+            strings[self._names[row]],
+            strings[self._plugins[row]],
+            strings[self._authors[row]],
+            self._versions[self._vers[row]],
+            strings[self._paths[row]])
+
+    def add(self, component):
+        """Add a component
+
+        Raises:
+            PyitectDupError: if the plugin version already provides it
+        """
+        if self._find(
+                component.name, component.plugin,
+                component.version) is not None:
+            raise PyitectDupError(
+                "Duplicate component %s provided by plugin %s@%s"
+                % (component.name, component.plugin, component.version))
+        name_id = self._intern(component.name)
+        plugin_id = self._intern(component.plugin)
+        version_id = self._intern_version(component.version)
+        row = len(self._names)
+        self._names.append(name_id)
+        self._plugins.append(plugin_id)
+        self._authors.append(self._intern(component.author))
+        self._vers.append(version_id)
+        self._paths.append(self._intern(component.path))
+        if name_id not in self._rows:
+            self._rows[name_id] = array.array("i")
+            self._row_plugins[name_id] = array.array("i")
+            self._row_vers[name_id] = array.array("i")
+        index = self._index(name_id, plugin_id, version_id)
+        self._rows[name_id].insert(index, row)
+        self._row_plugins[name_id].insert(index, plugin_id)
+        self._row_vers[name_id].insert(index, version_id)
+        self._plugin_names.pop(name_id, None)
+
+    def remove(self, component):
+        """Remove a component, if it's in the map
+
+        the row is only unlinked, it's column values stay behind
+        """
+        row = self._find(component.name, component.plugin, component.version)
+        if row is None:
+            return
+        name_id = self._names[row]
+        index = self._index(name_id, self._plugins[row], self._vers[row])
+        del self._rows[name_id][index]
+        del self._row_plugins[name_id][index]
+        del self._row_vers[name_id][index]
+        self._plugin_names.pop(name_id, None)
+        if not self._rows[name_id]:
+            del self._rows[name_id]
+            del self._row_plugins[name_id]
+            del self._row_vers[name_id]
+
+    def get_component(self, name, plugin, version):
+        """returns the :class:`Component` or `None` if it isn't provided"""
+        row = self._find(name, plugin, version)
+        if row is None:
+            return None
+        return self._component(row)
+
+    def plugin_names(self, name):
+        """returns a list of the names of the plugins providing a component"""
+        name_id = self._string_ids.get(name)
+        if name_id not in self._rows:
+            return []
+        names = self._plugin_names.get(name_id)
+        if names is None:
+            names = []
+            last = None
+            for plugin_id in self._row_plugins[name_id]:
+                if plugin_id != last:
+                    names.append(self._strings[plugin_id])
+                    last = plugin_id
+            self._plugin_names[name_id] = names
+        return list(names)
+
+    def versions(self, name, plugin):
+        """returns a list of the versions of a plugin providing a component"""
+        name_id = self._string_ids.get(name)
+        plugin_id = self._string_ids.get(plugin)
+        if name_id not in self._rows or plugin_id is None:
+            return []
+        start, end = self._plugin_range(name_id, plugin_id)
+        return [
+            self._versions[version_id]
+            for version_id in self._row_vers[name_id][start:end]]
+
+    def keys(self):
+        """returns a list of the component names"""
+        return [self._strings[name_id] for name_id in self._rows]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, name):
+        return self._string_ids.get(name) in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        providers = {}
+        for row in self._rows[self._string_ids[name]]:
+            plugin = self._strings[self._plugins[row]]
+            if plugin not in providers:
+                providers[plugin] = {}
+            providers[plugin][self._versions[self._vers[row]]] = \
+                self._component(row)
+        return providers
+
+
+def _check_load_hint(hint, path):
+    if hint not in LOAD_HINTS:
+        raise ValueError(
+            "Plugin at '%s' has a load hint '%s' that is not one of %s"
+            % (path, hint, ", ".join(LOAD_HINTS)))
+    return hint
+
+
+def _plugin_components(plugin):
+    """Build the :class:`Component` objects a plugin provides
+
+    the plugin's own metadata was checked when it was made,
+    only the provided names and paths need checking
+    """
+    components = []
+    for name, path in plugin.provides.items():
+        if not path:
+            path = name
+        if not isinstance(name, basestring):
+            raise TypeError("name must be a string component name")
+        if not isinstance(path, basestring):
+            raise TypeError("path must be a string path to object")
+        components.append(Component._trusted(
+            name,
+            plugin.name,
+            plugin.author,
+            plugin.version,
+            path))
+    return components
+
+
+class Catalogue(object):
+    """A shared set of discovered plugins
+
+    Discovery is done once into a catalogue and any number of
+    :class:`System` s can then be created on top of it, each with its own
+    configuration, enabled plugins and loaded components, without searching
+    again or creating :class:`Plugin` and :class:`Component` objects again.
+
+    Plugin modules are shared between the systems using a catalogue when the
+    components injected into them from :mod:`pyitect.imports` are the same
+    objects, so a plugin is only imported once per distinct set of resolved
+    dependencies.
+
+    the catalogue must not be changed once systems use it
+
+    Attributes:
+        plugins (dict): A mapping of plugin names to `dicts` of
+            :class:`Version` s mapped to :class:`Plugin` objects
+            like :attr:`System.plugins`
+        plugin_components (dict): A mapping of plugin `(name, version)` keys
+            to tuples of the :class:`Component` objects they provide
+        modules (dict): A mapping of unique module names to
+            `(module, injected)` tuples of the shared plugin modules and the
+            objects that were injected into them
+    """
+
+    def __init__(self, plugins):
+        """Init the catalogue
+
+        Args:
+            plugins (dict): A mapping of plugin names to `dicts` of
+                :class:`Version` s mapped to :class:`Plugin` objects
+        """
+        self.plugins = plugins
+        self.plugin_components = {}
+        self.modules = {}
+        for name in plugins:
+            for version in plugins[name]:
+                self.plugin_components[(name, version)] = tuple(
+                    _plugin_components(plugins[name][version]))
+
+    @classmethod
+    def discover(cls, *paths, **kwargs):
+        """Search paths for plugins and build a catalogue of them
+
+        Args:
+            *paths (str): paths to search, like :meth:`System.search`
+            enable_yaml (bool): Should yaml config files be supported?
+
+        Returns:
+            Catalogue: the discovered plugins
+        """
+        system = System({}, kwargs.get("enable_yaml", False))
+        for path in paths:
+            system.search(path)
+        return cls(system.plugins)
+
+    def owns(self, plugin):
+        """returns `True` if the :class:`Plugin` object is in the catalogue"""
+        versions = self.plugins.get(plugin.name)
+        return versions is not None and versions.get(plugin.version) is plugin
+
+    def system(self, config, **kwargs):
+        """Create a :class:`System` on top of the catalogue
+
+        Args:
+            config (dict): A mapping of component names to
+                version requirements
+            **kwargs: other keyword arguments for :class:`System`
+        """
+        return System(config, catalogue=self, **kwargs)
+
+    def get_module_name(self, plugin, injected):
+        """Get the unique name a plugin's shared module is imported under
+
+        Args:
+            plugin (Plugin): a plugin in the catalogue
+            injected (dict): the objects injected into :mod:`pyitect.imports`
+                for the import
+        """
+        parts = [plugin.get_module_name()]
+        for req_name in sorted(injected):
+            parts.append("%s=%d" % (req_name, id(injected[req_name])))
+        if len(parts) == 1:
+            return parts[0]
+        return get_unique_name(*parts)
+
+    def load_module(self, plugin, injected, scope=None):
+        """Fetch or import the module of a plugin
+
+        Args:
+            plugin (Plugin): a plugin in the catalogue
+            injected (dict): the objects injected into :mod:`pyitect.imports`
+                for the import
+            scope (None, object): the import scope providing the injected
+                objects, kept for the life of the shared module
+
+        Returns:
+            the shared module for this plugin and set of injected objects
+        """
+        module_name = self.get_module_name(plugin, injected)
+        if module_name not in self.modules:
+            module = plugin._load(module_name)
+            if scope is not None:
+                setattr(module, _SCOPE_ATTR, scope)
+            # the injected objects are kept alive with the module so their
+            # ids can't be reused while the module name is in use
+            self.modules[module_name] = (module, tuple(injected.values()))
+        return self.modules[module_name][0]
+
+    def close(self):
+        """Remove the shared plugin modules from `sys.modules`"""
+        for module_name, (module, injected) in self.modules.items():
+            scope = getattr(module, _SCOPE_ATTR, None)
+            if scope is not None:
+                scope.close()
+            _drop_modules(
+                module_name, os.path.dirname(getattr(module, "__file__", "")))
+        self.modules.clear()
+
+
+class ComponentStats(object):
+    """Call statistics of an instrumented component
+
+    the latency histogram is a fixed list of counters, bucket `i` counts the
+    calls that took less than `ComponentStats.bounds[i]` seconds (and not
+    less than the bound before it), the last bucket counts the slower ones.
+    calls from several threads are recorded under a lock
+
+    Attributes:
+        key (tuple): the :func:`Component.key` of the component
+        calls (int): number of calls
+        errors (int): number of calls that raised an exception
+        total_time (float): seconds spent in calls
+        buckets (list): call counts per latency bucket
+    """
+
+    __slots__ = ("key", "calls", "errors", "total_time", "buckets", "_lock")
+
+    bounds = tuple(0.000001 * 2 ** i for i in range(24))
+    """upper bounds of the latency buckets in seconds, 1us up to about 8s"""
+
+    def __init__(self, key):
+        self.key = key
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, error=False):
+        """Record a call
+
+        Args:
+            elapsed (float): seconds the call took
+            error (bool): did the call raise an exception
+        """
+        bucket = bisect.bisect_left(self.bounds, elapsed)
+        with self._lock:
+            self.calls += 1
+            if error:
+                self.errors += 1
+            self.total_time += elapsed
+            self.buckets[bucket] += 1
+
+    def mean(self):
+        """returns the mean call time in seconds"""
+        with self._lock:
+            calls, total_time = self.calls, self.total_time
+        if not calls:
+            return 0.0
+        return total_time / calls
+
+    def percentile(self, percent):
+        """Estimate a call time percentile from the histogram
+
+        Args:
+            percent (float): the percentile to estimate, 0 - 100
+
+        Returns:
+            float: the upper bound of the bucket holding the percentile,
+            `inf` if it falls in the last bucket
+        """
+        with self._lock:
+            calls, buckets = self.calls, list(self.buckets)
+        wanted = calls * percent / 100.0
+        seen = 0
+        for i, count in enumerate(buckets):
+            seen += count
+            if count and seen >= wanted:
+                if i < len(self.bounds):
+                    return self.bounds[i]
+                return float("inf")
+        return 0.0
+
+    def __repr__(self):
+        return "ComponentStats(%s@%s:%s calls=%d errors=%d mean=%.6fs)" % (
+            self.key[0], self.key[1], self.key[3],
+            self.calls, self.errors, self.mean())
+
+
+class LoadGraph(object):
+    """The plugin dependency graph of a system's loads, with timings
+
+    the weight of a plugin is it's self time, the time spent loading it
+    less the time spent loading the plugins it consumes. the critical path
+    is the heaviest chain of consumes dependencies, the chain that would
+    still gate readiness if every independent plugin was loaded at once.
+    a plugin with slack could take that much longer to load without
+    delaying readiness, it's load time is hidden behind others
+
+    Attributes:
+        times (dict): plugin version strings mapped to `(self, total)`
+            load times in seconds
+        edges (dict): plugin version strings mapped to `sets` of the
+            version strings of the plugins they consumed components from
+    """
+
+    def __init__(self, times, edges):
+        self.times = times
+        self.edges = edges
+
+    def _finishes(self):
+        """earliest finish time of every plugin, in dependency order"""
+        finishes = collections.OrderedDict()
+        for plugin in self.times:
+            stack = [plugin]
+            while stack:
+                node = stack[-1]
+                if node in finishes:
+                    stack.pop()
+                    continue
+                deps = [
+                    dep for dep in self.edges.get(node, ())
+                    if dep in self.times and dep not in finishes]
+                # a dependency already on the stack is a cycle, drop the edge
+                deps = [dep for dep in deps if dep not in stack]
+                if deps:
+                    stack.extend(deps)
+                    continue
+                stack.pop()
+                start = max([
+                    finishes.get(dep, 0.0)
+                    for dep in self.edges.get(node, ())] or [0.0])
+                finishes[node] = start + self.times[node][0]
+        return finishes
+
+    def critical_path(self):
+        """Compute the critical path
+
+        Returns:
+            tuple: `(plugins, duration)`, the version strings of the path's
+            plugins starting with the one loaded first and the sum of their
+            self times
+        """
+        finishes = self._finishes()
+        if not finishes:
+            return [], 0.0
+        node = max(sorted(finishes), key=lambda name: finishes[name])
+        duration = finishes[node]
+        path = []
+        while node is not None:
+            path.append(node)
+            deps = [
+                dep for dep in self.edges.get(node, ())
+                if dep in finishes and dep not in path]
+            if deps:
+                node = max(sorted(deps), key=lambda name: finishes[name])
+            else:
+                node = None
+        path.reverse()
+        return path, duration
+
+    def slack(self):
+        """Compute how much each plugin's load could grow without
+        delaying readiness
+
+        Returns:
+            dict: plugin version strings mapped to their slack in seconds,
+            `0` for the plugins on the critical path
+        """
+        finishes = self._finishes()
+        if not finishes:
+            return {}
+        end = max(finishes.values())
+        consumers = dict((plugin, []) for plugin in finishes)
+        for plugin in finishes:
+            for dep in self.edges.get(plugin, ()):
+                if dep in consumers:
+                    consumers[dep].append(plugin)
+        latest = {}
+        # latest finishes, consumers first
+        for plugin in reversed(finishes):
+            latest[plugin] = min([
+                latest.get(con, end) - self.times[con][0]
+                for con in consumers[plugin]] or [end])
+        return dict(
+            (plugin, max(0.0, latest[plugin] - finishes[plugin]))
+            for plugin in finishes)
+
+    def to_json(self):
+        """Serialise the graph, it's critical path and slack to JSON"""
+        path, duration = self.critical_path()
+        slack = self.slack()
+        return json.dumps({
+            "plugins": dict(
+                (plugin, {
+                    "self": times[0],
+                    "total": times[1],
+                    "slack": slack.get(plugin, 0.0),
+                    "consumes": sorted(self.edges.get(plugin, ())),
+                })
+                for plugin, times in self.times.items()),
+            "critical_path": path,
+            "duration": duration,
+        }, indent=2, sort_keys=True)
+
+    def to_dot(self):
+        """Render the graph in Graphviz DOT, edges point from a plugin to
+        the plugins it consumes and the critical path is drawn in red"""
+        path = self.critical_path()[0]
+        on_path = set(zip(path[1:], path[:-1]))
+        lines = ["digraph pyitect {"]
+        for plugin in sorted(self.times):
+            lines.append(
+                '    "%s" [label="%s\\nself %.6fs\\ntotal %.6fs"%s];' % (
+                    plugin, plugin,
+                    self.times[plugin][0], self.times[plugin][1],
+                    ', color="red"' if plugin in path else ""))
+        for plugin in sorted(self.edges):
+            for dep in sorted(self.edges[plugin]):
+                lines.append('    "%s" -> "%s"%s;' % (
+                    plugin, dep,
+                    ' [color="red"]' if (plugin, dep) in on_path else ""))
+        lines.append("}")
+        return "\n".join(lines)
+
+
+class InstrumentedComponent(object):
+    """Wraps a callable component to count and time its calls
+
+    calls are recorded in a :class:`ComponentStats` object, attribute access
+    is passed through to the wrapped component.
+    classes are never wrapped so they can still be subclassed and used with
+    `isinstance`
+
+    Attributes:
+        stats (ComponentStats): the statistics calls are recorded in
+    """
+
+    def __init__(self, obj, stats):
+        self.__wrapped__ = obj
+        self.stats = stats
+        # Python 2's update_wrapper fails on missing attributes
+        functools.update_wrapper(
+            self, obj,
+            assigned=[name for name in functools.WRAPPER_ASSIGNMENTS
+                      if hasattr(obj, name)],
+            updated=())
+
+    def __call__(self, *args, **kwargs):
+        start = _clock()
+        error = False
+        try:
+            return self.__wrapped__(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.stats.record(_clock() - start, error)
+
+    def __getattr__(self, name):
+        if name == "__wrapped__":
+            raise AttributeError(name)
+        return getattr(self.__wrapped__, name)
+
+    def __repr__(self):
+        return "InstrumentedComponent(%r)" % (self.__wrapped__,)
+
+
+_UNRESOLVED = object()
+
+
+class ComponentHandle(object):
+    """A cached reference to a component, made with :meth:`System.handle`
+
+    getting the component is a single attribute read while the handle is
+    valid, the system invalidates it's handles when the providers or the
+    config change and the next use loads the component again
+
+    calling the handle calls the component
+
+    Attributes:
+        component (str): the name of the component
+    """
+
+    def __init__(self, system, component, requires=None, bypass=False,
+                 subs=True, key=None, reverse=False):
+        self.component = component
+        self._system = weakref.ref(system)
+        self._kwargs = dict(
+            requires=requires, bypass=bypass,
+            subs=subs, key=key, reverse=reverse)
+        self._obj = _UNRESOLVED
+        self._generation = 0
+        # the plugin the component object came from
+        self._plugin_key = None
+
+    def get(self):
+        """Get the component object, loading it if the handle was
+        invalidated
+
+        Raises:
+            PyitectError: if the handle's system is gone
+            PyitectLoadError: if there is an exception during the load
+        """
+        obj = self._obj
+        if obj is _UNRESOLVED:
+            obj = self._resolve()
+        return obj
+
+    def _resolve(self):
+        system = self._system()
+        if system is None:
+            raise PyitectError(
+                "Handle to '%s' outlived it's system" % (self.component,))
+        generation = self._generation
+        component, plugin, version, reqs = system._resolve(
+            self.component, **self._kwargs)
+        obj = system.load_component(component, plugin, version, requires=reqs)
+        # don't keep what was loaded if the handle got invalidated meanwhile
+        if generation == self._generation:
+            self._plugin_key = (plugin, version)
+            self._obj = obj
+        return obj
+
+    def invalidate(self):
+        """Forget the component object so the next use loads it again"""
+        self._generation += 1
+        self._obj = _UNRESOLVED
+
+    def __call__(self, *args, **kwargs):
+        obj = self._obj
+        if obj is _UNRESOLVED:
+            obj = self._resolve()
+        return obj(*args, **kwargs)
+
+    def __repr__(self):
+        return "ComponentHandle(%r)" % (self.component,)
+
+
 class System(object):
     """A plugin system
 
@@ -405,8 +1406,9 @@ class System(object):
         plugin_loaded (str): version string of the plugin that the component
             was loaded from (version string ie 'plugin_name:version')
 
-    Pyitect keeps track of all the instances of the System class in
-    `System.systems` which is a map of object id's to instances of System.
+    Pyitect keeps track of all the live instances of the System class in
+    `System.systems` which is a weak set of System instances. a system is
+    dropped from it when it is closed or garbage collected.
 
     Attributes:
 
@@ -418,9 +1420,10 @@ class System(object):
         components (dict): A mapping of :func:`Component.key` s to
             loaded component objects
 
-        component_map (dict): A mapping of components the system knows about.
-            Maps names to `dicts` of :class:`Version` s mapped to
-            :class:`Component` config objects
+        component_map (ComponentMap): A mapping of components the system
+            knows about. Maps names to `dicts` of plugin names mapped to
+            `dicts` of :class:`Version` s mapped to :class:`Component`
+            config objects, or a :class:`CompactComponentMap`
 
         loaded_plugins (dict): A mapping of :func:`Plugin.key` s to
             loaded plugin module objects
@@ -432,12 +1435,119 @@ class System(object):
 
         events (dict): A mapping of event names to lists of callable objects
 
-    """
+        plugin_memory (dict): A mapping of plugin `(name, version)` keys to
+            `dicts` of the bytes allocated during the plugin's `load` and
+            `on_enable`. only filled if the system tracks memory. tracemalloc
+            counts the whole process, so hooks running at the same time on
+            `on_enable_workers` threads are charged each other's allocations
+
+        process_host (ProcessHost, None): the pool of worker processes
+            hosting plugins, `None` unless :meth:`host_plugins` was called
+
+        call_stats (dict): A mapping of :func:`Component.key` s to
+            :class:`ComponentStats` of instrumented components.
+            only filled if the system instruments components
+
+        catalogue (Catalogue, None): the shared catalogue the system was
+            created on, its plugins are used instead of searching
+
+        defer_on_enable (bool): are `on_enable` hooks run when a plugin is
+            first loaded instead of when it is enabled?
+
+        pending_on_enables (dict): A mapping of plugin `(name, version)` keys
+            to enabled :class:`Plugin` s whose `on_enable` hasn't run yet
+
+        on_enable_workers (int, None): number of threads `on_enable` hooks
+            are run on, `None` runs them one at a time stopping at the first
+            error
+
+        lazy_imports (bool): are consumed components loaded when a plugin
+            first imports them from :mod:`pyitect.imports` instead of
+            before it is imported?
+
+        max_loaded_plugins (int, None): how many plugin modules can stay
+            loaded before the least recently used are evicted
+
+        max_loaded_memory (int, None): how many bytes the loaded plugins can
+            have allocated before the least recently used are evicted
+
+        plugin_deps (dict): A mapping of loaded plugin `(name, version)` keys
+            to `sets` of the keys of the plugins their consumed components
+            were loaded from. a plugin still consumed by a loaded plugin
+            is never evicted
+
+        consumed_providers (dict): A mapping of loaded plugin
+            `(name, version)` keys to `dicts` of the component names they
+            consume mapped to the `(component, plugin, version)` tuples
+            they were loaded from, used by :meth:`update_config`
+
+        load_profile (dict): A mapping of plugin `(name, version)` keys to
+            `dicts` with the `self` and `total` seconds their last load took,
+            see :meth:`load_graph`
+
+        tracer (Tracer): the :class:`Tracer <pyitect.tracing.Tracer>` the
+            system's spans are sent to
+
+        handles (WeakSet): the live :class:`ComponentHandle` s created
+            by :meth:`handle`
+
+        stats (dict): counters of the system's plugin cache, `evictions` is
+            how many times a plugin was evicted and `reloads` how many times
+            an evicted plugin was imported again. `prefetches` counts the
+            plugins queued for prefetching, `prefetch_hits` the prefetched
+            modules a load used, `prefetch_cancelled` the prefetches a load
+            got to before they started, `prefetch_errors` the prefetches
+            that failed, `prefetch_skipped` the prefetches not queued
+            because `prefetch_limit` unused ones were held and
+            `prefetch_wasted` the prefetched modules the system closed
+            without using. `budget_violations` counts the imports and
+            `on_enable` hooks that went over budget and `deadline_aborts`
+            the imports given up on
+
+        import_budget (float, None): seconds a plugin's import or `on_enable`
+            can take before a warning
+
+        import_deadline (float, None): seconds a plugin's import can take
+            before the load gives up on it
 
-    systems = []
-    """A list of all :class:`System` instances"""
+        plugin_budgets (dict): plugin names mapped to `dicts` with `budget`
+            and `deadline` keys for that plugin
 
-    def __init__(self, config, enable_yaml=False):
+        budget_violations (list): `(plugin, phase, duration, budget)` tuples
+            of the imports and `on_enable` hooks that went over budget,
+            `plugin` is the plugin version string and `phase` is `"load"` or
+            `"on_enable"`
+
+        prefetch_workers (int, None): number of threads prefetching the
+            plugins a loading plugin will need, `None` doesn't prefetch
+
+        prefetch_limit (int): the most prefetches that can be queued or
+            held unused at once
+
+        on_enable_report (list): `(plugin, duration, error)` tuples of the
+            hooks run by the last batch of `on_enable` hooks when
+            `on_enable_workers` is set. `plugin` is the plugin version
+            string, `duration` the seconds spent loading the plugin and
+            running its hook and `error` the exception raised or `None`
+
+    """
+
+    # the systems tracking memory and if pyitect started tracemalloc
+    # for them, it's stopped when the last of them is closed
+    _tracemalloc_users = 0
+    _started_tracemalloc = False
+    _tracemalloc_lock = threading.Lock()
+
+    systems = weakref.WeakSet()
+    """A weak set of all live :class:`System` instances"""
+
+    def __init__(self, config, enable_yaml=False, track_memory=False,
+                 instrument=False, catalogue=None, defer_on_enable=False,
+                 on_enable_workers=None, lazy_imports=False,
+                 max_loaded_plugins=None, max_loaded_memory=None,
+                 tracer=None, prefetch_workers=None, prefetch_limit=32,
+                 component_map=None, import_budget=None,
+                 import_deadline=None, plugin_budgets=None):
         """Setup the system and load a configuration
 
         that may spesify plugins and versions to use for spesifc components
@@ -447,10 +1557,57 @@ class System(object):
         Args:
             config (dict): A mapping of component names to version requirements
             enable_yaml (bool): Should the system support yaml config files?
+            track_memory (bool): Should the system account the memory
+                allocated by each plugin's import and `on_enable`?
+                needs `tracemalloc` (Python 3.4+), ignored otherwise
+            instrument (bool): Should loaded callable components be wrapped
+                to count their calls and time them? see
+                :class:`InstrumentedComponent`
+            catalogue (Catalogue, None): A :class:`Catalogue` of already
+                discovered plugins to share instead of searching
+            defer_on_enable (bool): Should `on_enable` hooks wait until a
+                component of their plugin is loaded instead of running when
+                the plugin is enabled? see :meth:`flush_on_enables`
+            on_enable_workers (int, None): if set `on_enable` hooks run in
+                dependency order on this many threads and their failures
+                are reported together
+            lazy_imports (bool): Should a consumed component only be loaded
+                when its plugin imports it from :mod:`pyitect.imports`?
+                needs Python 3.7+, ignored otherwise. plugins from a
+                :class:`Catalogue` always get all their components up front
+            max_loaded_plugins (int, None): if set the least recently used
+                plugins are unloaded to keep at most this many loaded
+            max_loaded_memory (int, None): if set the least recently used
+                plugins are unloaded to keep the bytes allocated by loaded
+                plugins under it. turns on `track_memory`, so it needs
+                `tracemalloc` (Python 3.4+) and is ignored otherwise
+            tracer (Tracer, None): a :class:`Tracer <pyitect.tracing.Tracer>`
+                to send spans for the system's phases to, `None` uses
+                a :class:`NullTracer <pyitect.tracing.NullTracer>`
+            prefetch_workers (int, None): if set, when a plugin is loaded
+                the plugins it will need that consume nothing themselves are
+                imported ahead of time on this many background threads
+            prefetch_limit (int): the most prefetches that can be queued or
+                held unused at once
+            component_map (None, object): an empty registry for the enabled
+                components, like a :class:`CompactComponentMap` for very
+                large catalogues. `None` uses a :class:`ComponentMap`
+            import_budget (float, None): seconds a plugin's import or
+                `on_enable` can take before a :class:`PyitectBudgetWarning`
+            import_deadline (float, None): seconds a plugin's import can
+                take before the load gives up on it with a
+                :class:`PyitectLoadError`. the import runs on another thread
+                and gets all it's consumed components before it starts.
+                the plugin can't be loaded again until an import that
+                passed it's deadline finishes
+            plugin_budgets (dict, None): plugin names mapped to `dicts` with
+                `budget` and `deadline` keys replacing the system wide ones
+                for that plugin
         """
         global _have_yaml
+        global _have_tracemalloc
 
-        if not isinstance(config, collections.Mapping):
+        if not isinstance(config, Mapping):
             raise PyitectError(
                 "System configurations must be mappings of component "
                 "names to 'plugin:version' strings")
@@ -460,15 +1617,260 @@ class System(object):
         else:
             self._yaml = False
 
+        self._lock = threading.RLock()
+        if tracer is None:
+            tracer = NullTracer()
+        self.tracer = tracer
+        self.handles = weakref.WeakSet()
         self.config = config
-        self.plugins = {}
+        self.catalogue = catalogue
+        if catalogue is not None:
+            # shared until the system adds a plugin of its own
+            self.plugins = catalogue.plugins
+        else:
+            self.plugins = {}
         self.components = {}
-        self.component_map = {}
+        if component_map is None:
+            component_map = ComponentMap()
+        self.component_map = component_map
         self.loaded_plugins = {}
         self.enabled_plugins = []
+        self._enabled_keys = set()
         self.using = []
         self.events = {}
-        System.systems.append(self)
+        self.plugin_memory = {}
+        # each thread has it's own stack, `on_enable` hooks can run on
+        # `on_enable_workers` threads at once
+        self._memory_local = threading.local()
+        self.load_profile = {}
+        self._time_stack = []
+        self.defer_on_enable = defer_on_enable
+        self.pending_on_enables = {}
+        self.on_enable_workers = on_enable_workers
+        self.on_enable_report = []
+        self.lazy_imports = lazy_imports
+        # plugin keys mapped to the import scopes of the plugin modules
+        # the system imported itself
+        self._import_scopes = {}
+        self.max_loaded_plugins = max_loaded_plugins
+        self.max_loaded_memory = max_loaded_memory
+        self.plugin_deps = {}
+        self.consumed_providers = {}
+        self.stats = {
+            "evictions": 0, "reloads": 0,
+            "prefetches": 0, "prefetch_hits": 0, "prefetch_cancelled": 0,
+            "prefetch_errors": 0, "prefetch_skipped": 0,
+            "prefetch_wasted": 0, "budget_violations": 0,
+            "deadline_aborts": 0}
+        self.import_budget = import_budget
+        self.import_deadline = import_deadline
+        # plugin keys mapped to the threads of imports that passed their
+        # deadline, they can't be stopped
+        self._deadline_threads = {}
+        if plugin_budgets is None:
+            plugin_budgets = {}
+        self.plugin_budgets = plugin_budgets
+        self.budget_violations = []
+        self._eager_components = collections.deque()
+        self._idle_components = collections.deque()
+        self._have_lazy_hints = False
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_limit = prefetch_limit
+        self._prefetches = {}
+        self._prefetch_queue = None
+        self._prefetch_lock = threading.Lock()
+        self._plugin_lru = collections.OrderedDict()
+        self._evicted = set()
+        self._load_depth = 0
+        self._loading = []
+        self.process_host = None
+        self.call_stats = {}
+        self._instrument = instrument
+        self._track_memory = _have_tracemalloc and (
+            track_memory or max_loaded_memory is not None)
+        if self._track_memory:
+            with System._tracemalloc_lock:
+                System._tracemalloc_users += 1
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    System._started_tracemalloc = True
+        System.systems.add(self)
+
+    @property
+    def config(self):
+        """A mapping of component names to version requirements
+
+        assigning a new config invalidates the system's handles,
+        changing the mapping in place does not, call
+        :meth:`invalidate_handles` after doing that. already loaded plugins
+        are left alone, :meth:`update_config` reloads the affected ones
+        """
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        self.invalidate_handles()
+
+    def _resolved_key(self, component, requires):
+        """The provider `component` resolves to with only `requires`,
+        `None` if it can't be resolved"""
+        try:
+            return self._resolve(component, requires, bypass=True)[:3]
+        except PyitectError:
+            return None
+
+    def update_config(self, config):
+        """Replace the config, reloading only what the change affects
+
+        a loaded plugin is affected when a component it consumes now
+        resolves to another provider, plugins consuming an affected plugin
+        are affected too. affected plugins are evicted and the components
+        the system had loaded from them that no affected plugin consumed
+        are loaded again with the new config, loading what they consume
+        the way the first load did. everything else keeps it's loaded
+        objects
+
+        `on_enable` hooks of reloaded plugins are not run again
+
+        Args:
+            config (dict): A mapping of component names to version
+                requirements
+
+        Returns:
+            dict: the delta, `changed` is the sorted component names whose
+            requirements changed, `rebound` maps the changed components
+            the system resolves to another provider now to
+            `(old, new)` tuples of `(component, plugin, version)` tuples
+            (`None` if it can't be resolved), `reloaded` is the sorted
+            version strings of the affected plugins and `components` the
+            :func:`Component.key` s of the affected plugins loaded again
+
+        Raises:
+            PyitectError: If `config` is not a mapping
+            PyitectLoadError: If an affected component can't be loaded
+                with the new config, the config is updated already
+        """
+        if not isinstance(config, Mapping):
+            raise PyitectError(
+                "System configurations must be mappings of component "
+                "names to 'plugin:version' strings")
+        with self._lock:
+            old = self._config
+            changed = set(
+                name for name in set(old) | set(config)
+                if old.get(name) != config.get(name))
+            rebound = {}
+            for name in changed:
+                if name in self.component_map:
+                    before = self._resolved_key(name, old)
+                    after = self._resolved_key(name, config)
+                    if before != after:
+                        rebound[name] = (before, after)
+
+            affected = set()
+            for consumer, provided in self.consumed_providers.items():
+                if consumer not in self.loaded_plugins:
+                    continue
+                cfg = self.plugins[consumer[0]][consumer[1]]
+                reqs = _layer_requires(config, cfg.consumes)
+                for req_name in changed.intersection(provided):
+                    if (self._resolved_key(req_name, reqs)
+                            != provided[req_name]):
+                        affected.add(consumer)
+                        break
+            # plugins holding objects from an affected plugin go too
+            grown = True
+            while grown:
+                grown = False
+                for consumer, deps in self.plugin_deps.items():
+                    if consumer not in affected and deps & affected:
+                        affected.add(consumer)
+                        grown = True
+
+            affected_keys = sorted(
+                key for key in self.components
+                if (key[1], key[3]) in affected)
+            # components an affected plugin consumed are loaded again by
+            # that plugin, with the requirements it layers on the config
+            consumed = set(
+                provided
+                for consumer in affected
+                for provided in self.consumed_providers.get(
+                    consumer, {}).values())
+            root_keys = [
+                key for key in affected_keys
+                if (key[0], key[1], key[3]) not in consumed]
+            for plugin_key in affected:
+                self.evict_plugin(*plugin_key)
+            self.config = config
+            for key in root_keys:
+                self.load_component(
+                    key[0], key[1], key[3], requires=config)
+            reload_keys = [
+                key for key in affected_keys if key in self.components]
+        return {
+            "changed": sorted(changed),
+            "rebound": rebound,
+            "reloaded": sorted(
+                self.plugins[name][version].get_version_string()
+                for name, version in affected),
+            "components": reload_keys,
+        }
+
+    def close(self):
+        """Release everything the system has loaded
+
+        stops the process host, unloads the plugin modules removing them
+        from `sys.modules`, empties the registries and removes the
+        system from `System.systems`.
+        a closed system is finished, create a new system to load
+        plugins again
+        """
+        if self.process_host is not None:
+            self.process_host.close()
+            self.process_host = None
+        self._stop_prefetching()
+        for name in self.plugins:
+            for version in self.plugins[name]:
+                plugin = self.plugins[name][version]
+                # the catalogue owns the modules of its plugins
+                if self.catalogue is None or not self.catalogue.owns(plugin):
+                    plugin.unload()
+        self.components.clear()
+        self.loaded_plugins.clear()
+        self.component_map.clear()
+        self.plugins = {}
+        del self.enabled_plugins[:]
+        self._enabled_keys.clear()
+        del self.using[:]
+        self.events.clear()
+        self.call_stats.clear()
+        self.plugin_memory.clear()
+        self.load_profile.clear()
+        self.pending_on_enables.clear()
+        self.invalidate_handles()
+        self.plugin_deps.clear()
+        self.consumed_providers.clear()
+        del self.budget_violations[:]
+        self._deadline_threads.clear()
+        self._eager_components.clear()
+        self._idle_components.clear()
+        self._plugin_lru.clear()
+        self._evicted.clear()
+        for scope in self._import_scopes.values():
+            scope.close()
+        self._import_scopes.clear()
+        if self._track_memory:
+            self._track_memory = False
+            with System._tracemalloc_lock:
+                System._tracemalloc_users -= 1
+                # only stop tracing pyitect started once no system uses it
+                if (not System._tracemalloc_users
+                        and System._started_tracemalloc):
+                    tracemalloc.stop()
+                    System._started_tracemalloc = False
+        System.systems.discard(self)
 
     def bind_event(self, event, function):
         """Bind a callable object to the event name
@@ -588,67 +1990,89 @@ class System(object):
 
         for com in comps:
             if com in self.component_map and issubcomponent(com, comp):
-                providers = self.component_map[com]
-                for prov in providers:
-                    versions = providers[prov]
+                for prov in self.component_map.plugin_names(com):
+                    versions = self.component_map.versions(com, prov)
                     if vers:
                         for ver in sorted(versions):
                             yield (com, prov, ver)
                     else:
                         yield (com, prov, spec.select(versions))
 
-    def _enable_plugin(self, plugin):
-        # loop through and map component names to a listing of plugin names and
-        # versions
+    def _collect_plugins(self, plugins):
+        """Flatten the arguments of :meth:`enable_plugins` to a list"""
+        collected = []
+        for arg in plugins:
+            if isinstance(arg, Plugin):
+                collected.append(arg)
+                continue
+            if isinstance(arg, Mapping):
+                # passed a dictionary
+                items = arg.values()
+            elif isinstance(arg, Iterable):
+                # not a map but iterable
+                items = arg
+            else:
+                raise TypeError("'%r' is not a plugin" % str(arg))
+            for plugin in items:
+                if not isinstance(plugin, Plugin):
+                    raise PyitectError("'%r' is not a plugin" % str(plugin))
+                collected.append(plugin)
+        return collected
 
-        # save the plugin as enabled
-        plugin_key = (plugin.name, plugin.version)
-        if plugin_key not in self.enabled_plugins:
-            self.enabled_plugins.append(plugin_key)
-
-        for name, path in plugin.provides.items():
-
-            # ensure a place to list component providing plugin versions
-            if name not in self.component_map:
-                self.component_map[name] = {}
-            if plugin.name not in self.component_map[name]:
-                self.component_map[name][plugin.name] = {}
-            if plugin.version in self.component_map[name][plugin.name]:
-                raise PyitectDupError(
-                    "Duplicate component %s provided by plugin %s@%s"
-                    % (name, plugin.name, plugin.version))
-
-            if not path:
-                path = name
-
-            component = Component(
-                name,
-                plugin.name,
-                plugin.author,
-                plugin.version,
-                path)
-
-            self.component_map[name][plugin.name][plugin.version] = component
-
-    def _enable_plugins_map(self, plugins):
-        on_enables = []
-        for k in plugins:
-            plugin = plugins[k]
-            if not isinstance(plugin, Plugin):
-                raise PyitectError("'%r' is not a plugin" % str(plugin))
-            if plugin.has_on_enable():
-                on_enables.append(plugin)
-            self._enable_plugin(plugin)
-        return on_enables
+    def _enable_plugin_batch(self, plugins):
+        """Map the components of many plugins at once
+
+        every component is checked for duplicates before the map is changed
+        so a :class:`PyitectDupError` leaves it as it was
+
+        Returns:
+            list: the plugins with `on_enable` hooks
+        """
+        batch = []
+        seen = set()
+        for plugin in plugins:
+            plugin_key = (plugin.name, plugin.version)
+            if self.catalogue is not None and self.catalogue.owns(plugin):
+                components = self.catalogue.plugin_components[plugin_key]
+            else:
+                components = _plugin_components(plugin)
+            for component in components:
+                key = (component.name, plugin.name, plugin.version)
+                if key in seen or self.component_map.get_component(
+                        *key) is not None:
+                    raise PyitectDupError(
+                        "Duplicate component %s provided by plugin %s@%s"
+                        % key)
+                seen.add(key)
+                batch.append((plugin, component))
+
+        added = []
+        try:
+            for plugin, component in batch:
+                self.component_map.add(component)
+                added.append(component)
+        except Exception:
+            for component in added:
+                self.component_map.remove(component)
+            raise
 
-    def _enable_plugins_iter(self, plugins):
         on_enables = []
         for plugin in plugins:
-            if not isinstance(plugin, Plugin):
-                raise PyitectError("'%r' is not a plugin" % str(plugin))
+            # save the plugin as enabled
+            plugin_key = (plugin.name, plugin.version)
+            if plugin_key not in self._enabled_keys:
+                self._enabled_keys.add(plugin_key)
+                self.enabled_plugins.append(plugin_key)
             if plugin.has_on_enable():
                 on_enables.append(plugin)
-            self._enable_plugin(plugin)
+        for plugin, component in batch:
+            hint = plugin.get_load_hint(component.name)
+            if hint == "eager":
+                self._eager_components.append(component)
+            elif hint == "idle":
+                self._idle_components.append(component)
+            elif hint == "lazy":
+                self._have_lazy_hints = True
         return on_enables
 
     def enable_plugins(self, *plugins):
@@ -657,6 +2081,9 @@ class System(object):
         Takes a plugins metadata and remembers it's provided components so
         the system is awear of them
 
+        all the plugins are enabled together, if one of them can't be
+        enabled none of them are
+
         Args:
             plugins (plugins): One or more plugins to enable.
                 Each argument can it self be a list or map of :class:`Plugin`
@@ -665,6 +2092,8 @@ class System(object):
         Raises:
             TypeError: If you try to pass a non :class:`Plugin` object
 
+            PyitectError: If a list or map holds a non :class:`Plugin` object
+
             PyitectDubError: If you try to enable a plugin
                 that provides duplicate conponent
 
@@ -673,41 +2102,192 @@ class System(object):
             PyitectLoadError: If there was an error loading a plugin
                 to call it's on_enable
         """
-        if len(plugins) == 1:
-            plugins = plugins[0]
+        self._finish_enable(self._enable_plugins(plugins))
+
+    def _enable_plugins(self, plugins):
+        """Enable plugins without running their `on_enable` hooks
 
-        if isinstance(plugins, collections.Mapping):
-            # passed a dictionary
-            on_enables = self._enable_plugins_map(plugins)
-        elif isinstance(plugins, collections.Iterable):
-            # not a map but iterable
-            on_enables = self._enable_plugins_iter(plugins)
+        Returns:
+            list: the plugins with an `on_enable` hook
+        """
+        try:
+            return self._enable_plugin_batch(self._collect_plugins(plugins))
+        finally:
+            # the providers may have changed
+            self.invalidate_handles()
+
+    def _finish_enable(self, on_enables):
+        """Run or defer the `on_enable` hooks of enabled plugins and load
+        the components they want loaded right away"""
+        if self.defer_on_enable:
+            for plugin in on_enables:
+                self.pending_on_enables[(plugin.name, plugin.version)] = plugin
         else:
-            # single plugin
-            plugin = plugins
-            if not isinstance(plugin, Plugin):
-                raise TypeError("'%r' is not a plugin" % str(plugin))
-            if plugin.has_on_enable():
-                    on_enables.append(plugin)
-            self._enable_plugin(plugin)
-        self._run_on_enables(on_enables)
+            self._run_on_enables(on_enables)
+        # components the plugins want loaded right away
+        while self._eager_components:
+            component = self._eager_components.popleft()
+            self.load_component(
+                component.name, component.plugin, component.version,
+                requires=self.config)
+
+    def warmup(self, limit=None):
+        """Load the components plugins marked to be loaded when idle
+
+        call it when the application has nothing better to do, a `limit`
+        lets it warm up a few components at a time
+
+        Args:
+            limit (int, None): the most components to load, `None` loads
+                all of them
+
+        Returns:
+            int: the number of idle components still waiting to be loaded
+        """
+        loaded = 0
+        while self._idle_components and (limit is None or loaded < limit):
+            component = self._idle_components.popleft()
+            if component.key() not in self.components:
+                self.load_component(
+                    component.name, component.plugin, component.version,
+                    requires=self.config)
+                loaded += 1
+        return len(self._idle_components)
 
     def _run_on_enables(self, *plugins):
         if len(plugins) == 1:
             plugins = plugins[0]
         if isinstance(plugins, Plugin):
-            self.load_plugin(
-                plugins.name,
-                plugins.version,
-                request=plugins.get_version_string() + ":on_enable")
-            plugins.run_on_enable()
-        elif isinstance(plugins, collections.Iterable):
+            plugins = (plugins,)
+        if self.on_enable_workers is not None:
+            self._run_on_enables_ordered(list(plugins))
+        elif isinstance(plugins, Iterable):
             for plugin in plugins:
-                self.load_plugin(
-                    plugin.name,
-                    plugin.version,
-                    request=plugin.get_version_string() + ":on_enable")
-                plugin.run_on_enable()
+                self._run_on_enable(plugin)
+
+    def _run_on_enables_ordered(self, plugins):
+        """Run hooks in dependency order on `on_enable_workers` threads
+
+        a hook only starts after the hooks of the plugins its plugin
+        consumes from (directly or not) are done
+        """
+        hooks = dict(((p.name, p.version), p) for p in plugins)
+        deps = dict(
+            (key, self._hook_dependencies(plugin, hooks))
+            for key, plugin in hooks.items())
+        results = _run_ordered(
+            list(hooks.keys()), deps,
+            lambda key: self._run_on_enable(hooks[key]),
+            self.on_enable_workers)
+
+        self.on_enable_report = []
+        failures = []
+        for key, (duration, error) in results:
+            name = hooks[key].get_version_string()
+            self.on_enable_report.append((name, duration, error))
+            if error is not None:
+                failures.append((name, error))
+        if failures:
+            err = PyitectOnEnableError(
+                "%d of %d on_enable hooks failed: %s"
+                % (len(failures), len(hooks),
+                   ", ".join(name for name, error in failures)),
+                cause=failures[0][1])
+            err.failures = failures
+            raise err
+
+    def _hook_dependencies(self, plugin, hooks):
+        """Find the plugins in `hooks` a plugin consumes from
+
+        follows consumed components through plugins not in `hooks`
+        """
+        found = set()
+        seen = set([(plugin.name, plugin.version)])
+        stack = [(plugin, plugin.consumes)]
+        while stack:
+            cfg, reqs = stack.pop()
+            for req_name in cfg.consumes:
+                try:
+                    comp, dep, dep_version, dep_reqs = self._resolve(
+                        req_name, requires=reqs)
+                except PyitectError:
+                    # the hook's load will report it
+                    continue
+                dep_key = (dep, dep_version)
+                if dep_key in seen:
+                    continue
+                seen.add(dep_key)
+                if dep_key in hooks:
+                    found.add(dep_key)
+                if dep in self.plugins and dep_version in self.plugins[dep]:
+                    dep_cfg = self.plugins[dep][dep_version]
+                    stack.append((
+                        dep_cfg,
+                        _layer_requires(dep_reqs, dep_cfg.consumes)))
+        return found
+
+    def _run_on_enable(self, plugin):
+        plugin_key = (plugin.name, plugin.version)
+        self.load_plugin(
+            plugin.name,
+            plugin.version,
+            request=plugin.get_version_string() + ":on_enable")
+        with self.tracer.span(
+                "run_on_enable", plugin=plugin.name, version=plugin.version):
+            start = _clock()
+            self._measure_memory(
+                plugin_key, "on_enable",
+                plugin.run_on_enable, self.loaded_plugins[plugin_key])
+            self._check_budget(
+                plugin, "on_enable", _clock() - start,
+                self._get_budget(plugin.name)[0])
+
+    def flush_on_enables(self):
+        """Run all the `on_enable` hooks that are still pending
+
+        only does anything if the system defers `on_enable` hooks,
+        each plugin is loaded and its hook run after the hooks of the
+        plugins it consumes from
+
+        Raises:
+            PyitectOnEnableError: If There was an error in the on_enable
+
+            PyitectLoadError: If there was an error loading a plugin
+                to call it's on_enable
+        """
+        while self.pending_on_enables:
+            pending = list(self.pending_on_enables.values())
+            if self.on_enable_workers is not None:
+                self.pending_on_enables.clear()
+                self._run_on_enables_ordered(pending)
+                continue
+            for plugin in self._hook_order(pending):
+                # a hook can load a plugin and run it's hook first
+                plugin_key = (plugin.name, plugin.version)
+                if self.pending_on_enables.pop(plugin_key, None) is not None:
+                    self._run_on_enable(plugin)
+
+    def _hook_order(self, plugins):
+        """Sort plugins so each comes after the plugins it consumes from
+
+        plugins in a dependency cycle keep the order they were given in
+        """
+        hooks = dict(((p.name, p.version), p) for p in plugins)
+        keys = [(p.name, p.version) for p in plugins]
+        waiting = dict(
+            (key, self._hook_dependencies(hooks[key], hooks)) for key in keys)
+        order = []
+        while waiting:
+            ready = [
+                key for key in keys if key in waiting and not waiting[key]]
+            if not ready:
+                ready = [key for key in keys if key in waiting][:1]
+            for key in ready:
+                del waiting[key]
+                order.append(hooks[key])
+            for deps in waiting.values():
+                deps.difference_update(ready)
+        return order
 
     def _read_plugin_cfg(self, path, is_yaml=False):
         with open(path) as cfgfile:
@@ -735,6 +2315,9 @@ class System(object):
         Args:
             path (str): path to a plugin folder
 
+        Returns:
+            Plugin: the added plugin
+
         Rasies:
             PyitectError: If no plugin exists at path
             PyitectDupError: if you try to add the same plugin twice
@@ -752,25 +2335,72 @@ class System(object):
                 break
 
         if cfgpath is not None and os.path.exists(cfgpath):
+            return self._add_plugin_cfg(path, cfgpath, is_yaml)
+        else:
+            raise PyitectError("No plugin exists at %s" % (path,))
 
-            cfg = self._read_plugin_cfg(cfgpath, is_yaml)
+    def _add_plugin_cfg(self, path, cfgpath, is_yaml):
+        """Adds the plugin at path from an already found config file"""
+        with self.tracer.span("add_plugin", path=path) as span:
+            plugin = self._add_plugin_obj(path, cfgpath, is_yaml)
+            span.set(plugin=plugin.name, version=plugin.version)
+        return plugin
 
-            plugin = Plugin(cfg, path)
-            name = plugin.name
-            version = plugin.version
-            if name not in self.plugins:
-                self.plugins[name] = {}
+    def _add_plugin_obj(self, path, cfgpath, is_yaml):
+        cfg = self._read_plugin_cfg(cfgpath, is_yaml)
+        return self._add_plugin(Plugin(cfg, path))
 
-            if version in self.plugins[name]:
-                raise PyitectDupError(
-                    "Duplicate plugin %s@%s at '%s'"
-                    % (name, version, path))
+    def register_plugin(self, config, module=None, source=None):
+        """Adds a plugin built in memory, see :class:`MemoryPlugin`
 
-            self.plugins[name][version] = plugin
-            self.fire_event('plugin_found', path, plugin.get_version_string())
+        nothing is read from disk. the plugin is enabled and loaded like
+        any other plugin
 
-        else:
-            raise PyitectError("No plugin exists at %s" % (path,))
+        Args:
+            config (dict): a mapping like a plugin config file,
+                `file` is optional
+            module (None, object): the plugin's module object
+            source (None, str): source code of the plugin's module
+
+        Returns:
+            MemoryPlugin: the added plugin
+
+        Raises:
+            ValueError: If the config is invalid or not exactly one of
+                `module` and `source` is given
+            PyitectDupError: if you try to add the same plugin twice
+        """
+        plugin = MemoryPlugin(config, module=module, source=source)
+        with self.tracer.span(
+                "add_plugin", path=plugin.path,
+                plugin=plugin.name, version=plugin.version):
+            return self._add_plugin(plugin)
+
+    def _add_plugin(self, plugin):
+        path = plugin.path
+        name = plugin.name
+        version = plugin.version
+        if self.catalogue is not None:
+            self._own_plugins(name)
+        if name not in self.plugins:
+            self.plugins[name] = {}
+
+        if version in self.plugins[name]:
+            raise PyitectDupError(
+                "Duplicate plugin %s@%s at '%s'"
+                % (name, version, path))
+
+        self.plugins[name][version] = plugin
+        self.fire_event('plugin_found', path, plugin.get_version_string())
+        return plugin
+
+    def _own_plugins(self, name):
+        """Copy the shared catalogue mappings the system is about to change"""
+        if self.plugins is self.catalogue.plugins:
+            self.plugins = dict(self.plugins)
+        if (name in self.plugins
+                and self.plugins[name] is self.catalogue.plugins.get(name)):
+            self.plugins[name] = dict(self.plugins[name])
 
     def is_plugin(self, path):
         """Test a path to see if it is a `Plugin`
@@ -793,41 +2423,116 @@ class System(object):
                 return True
         return False
 
-    def _search_dir(self, folder):
+    def _search_dir(self, folder, ignore=None, max_depth=None, levels=None):
         """
-        recursivly searches a folder for plugins
+        recursivly searches a folder for plugins, yielding each plugin
+        as soon as it is added
         """
+        # the config extentions in the order add_plugin prefers them
+        exts = [".json"]
+        if self._yaml:
+            exts = [".yml", ".yaml", ".json"]
+        if levels:
+            levels = frozenset(levels)
+            if max_depth is None or max(levels) < max_depth:
+                max_depth = max(levels)
         # avoid recursion, could get nasty in a sificently big tree, also
         # faster.
-        paths = [folder, ]
-        while len(paths) > 0:
-            # get the file names in the folder
-            path = paths.pop(0)
+        paths = collections.deque([(folder, 0)])
+        while paths:
+            # get the file names in the folder, each folder is listed once
+            path, depth = paths.popleft()
             names = os.listdir(path)
-            # loop through and identify plugins searching folders recursivly,
-            # stops recursive if there is a plugin in the folder.
+            # stops recursive if the folder is a plugin
+            if depth > 0 and (not levels or depth in levels):
+                base = os.path.basename(path)
+                found = [ext for ext in exts if base + ext in names]
+                if found:
+                    yield self._add_plugin_cfg(
+                        path, os.path.join(path, base + found[0]),
+                        found[0] != ".json")
+                    continue
+            if max_depth is not None and depth >= max_depth:
+                continue
+            # loop through and queue sub folders to search
             for name in names:
+                if ignore and any(fnmatch.fnmatch(name, pattern)
+                                  for pattern in ignore):
+                    continue
                 file = os.path.join(path, name)
                 if os.path.isdir(file):
-                    if self.is_plugin(file):
-                        self.add_plugin(file)
-                    else:
-                        paths.append(file)
+                    paths.append((file, depth + 1))
 
-    def search(self, path):
+    def search(self, path, ignore=None, max_depth=None, levels=None):
         """Search a path (dir or file) for a plugin
         in the case of a file it searches the containing dir.
 
+        the search never descends into a folder that is a plugin
+
         Args:
             path (str): the path to search
+            ignore (list, None): glob patterns of folder names not to
+                search, like `["__pycache__", ".*"]`
+            max_depth (int, None): the number of folder levels below
+                `path` to search, `None` for no limit
+            levels (list, None): the only levels below `path` plugins can
+                be at, where the folders directly in `path` are level 1.
+                folders at other levels are not checked for plugins and
+                the search stops at the deepest level
         """
         # we either have a folder or a file,
         # if it's a file is there a plugin in the folder containing it?
         # if it's a folder are the plugins located somewhere within?
+        with self.tracer.span("search", path=path):
+            for plugin in self._iter_search(path, ignore, max_depth, levels):
+                pass
+
+    def iter_search(self, path, ignore=None, max_depth=None, levels=None,
+                    enable=False):
+        """Search a path like :meth:`search`, yielding the plugins found
+
+        each :class:`Plugin` is yielded as soon as it's config is read, so
+        it can be enabled, and it's components loaded, while the rest of
+        the tree is still being searched. the search goes on when the next
+        plugin is asked for
+
+        the `on_enable` hooks of the plugins it enables, and the components
+        they want loaded right away, wait for the end of the search so the
+        plugins they consume from have been found. if the search is stopped
+        early the hooks are left for :meth:`flush_on_enables`
+
+        Args:
+            path (str): the path to search
+            ignore (list, None): like :meth:`search`
+            max_depth (int, None): like :meth:`search`
+            levels (list, None): like :meth:`search`
+            enable (bool): enable each plugin before it is yielded
+
+        Yields:
+            Plugin: the plugins found, in the order they are found
+        """
+        on_enables = []
+        with self.tracer.span("iter_search", path=path, enable=enable):
+            try:
+                for plugin in self._iter_search(
+                        path, ignore, max_depth, levels):
+                    if enable:
+                        on_enables.extend(self._enable_plugins([plugin]))
+                    yield plugin
+            except BaseException:
+                for plugin in on_enables:
+                    self.pending_on_enables[
+                        (plugin.name, plugin.version)] = plugin
+                raise
+            if enable:
+                self._finish_enable(on_enables)
+
+    def _iter_search(self, path, ignore, max_depth, levels):
         if os.path.isdir(path):
-            self._search_dir(path)
+            for plugin in self._search_dir(path, ignore, max_depth, levels):
+                yield plugin
         else:
-            self.add_plugin(os.path.dirname(path))
+            yield self.add_plugin(os.path.dirname(path))
 
     def resolve_highest_match(self, component, plugin, spec):
         """resolves the latest version of a component with requirements,
@@ -867,14 +2572,14 @@ class System(object):
         if plugin == "":
             # we are gettign the first plugin name in a acending alpha-numeric
             # sort
-            plugin = sorted(list(self.component_map[component].keys()))[0]
+            plugin = sorted(self.component_map.plugin_names(component))[0]
 
-        if plugin not in self.component_map[component]:
+        versions = self.component_map.versions(component, plugin)
+        if not versions:
             raise PyitectError(
                 "Component '%s' is not provided by plugin '%s'"
                 % (component, plugin))
 
-        versions = self.component_map[component][plugin].keys()
         highest_valid = spec.select(versions)
 
         if not highest_valid:
@@ -923,48 +2628,191 @@ class System(object):
             raise PyitectNotProvidedError(
                 "Component '%s' is not provided by any plugin"
                 % (component,))
-        if (plugin not in self.component_map[component]
-                or version not in self.component_map[component][plugin]):
+        comp = self.component_map.get_component(component, plugin, version)
+        if comp is None:
             raise PyitectNotProvidedError(
                 "Component '%s' is not provided by plugin '%s@%s'"
                 % (component, plugin, version))
 
-        comp = self.component_map[component][plugin][version]
+        key = comp.key()
+        _check_not_prefetching()
+        with self._lock:
+            self._load_depth += 1
+            try:
+                if key not in self.components:
+                    self._load_component_obj(
+                        comp, component, plugin, version, requires, request)
+                self._touch_plugin((plugin, version))
+                comp_obj = self.components[key]
+            finally:
+                self._end_load()
+
+        return comp_obj
 
+    def _load_component_obj(self, comp, component, plugin, version,
+                            requires, request):
+        """Loads but does not return a component object"""
         key = comp.key()
-        if key not in self.components:
+        if (self.process_host is not None
+                and plugin in self.process_host.plugins):
+            obj = self._load_hosted_component(comp, requires)
+        else:
+            obj = self._get_component_obj(
+                comp,
+                self.load_plugin(
+                    plugin, version,
+                    requires=requires, request=request, comp=component))
 
-            plugin_obj = self.load_plugin(
-                plugin, version,
-                requires=requires, request=request, comp=component)
+        if self._instrument and callable(obj) and not inspect.isclass(obj):
+            self.call_stats[key] = ComponentStats(key)
+            obj = InstrumentedComponent(obj, self.call_stats[key])
 
-            obj = plugin_obj
-            parts = comp.path.split(".")
-            for part in parts:
-                if not hasattr(obj, part):
-                    raise PyitectNotProvidedError(
-                        "Plugin '%s:%s' does not have name '%s'"
-                        % (plugin, version, comp.path))
-                obj = getattr(obj, part)
+        self.components[key] = obj
 
-            self.components[key] = obj
+        # record the use of this component, perhaps so the users can save
+        # the configuration
+        self.using.append(key)
 
-            # record the use of this component, perhaps so the users can save
-            # the configuration
-            self.using.append(key)
+        self.fire_event(
+            'component_loaded',
+            component,
+            request,
+            plugin + ":" + str(version)
+            )
+
+    def _get_component_obj(self, comp, plugin_obj):
+        """Follow a component's path from the top of its plugin module"""
+        obj = plugin_obj
+        parts = comp.path.split(".")
+        for part in parts:
+            if not hasattr(obj, part):
+                raise PyitectNotProvidedError(
+                    "Plugin '%s:%s' does not have name '%s'"
+                    % (comp.plugin, comp.version, comp.path))
+            obj = getattr(obj, part)
+        return obj
+
+    def host_plugins(self, plugins, processes=None):
+        """Load plugins in a pool of worker processes
+
+        components provided by the hosted plugins are loaded as
+        :class:`RemoteComponent <pyitect.workers.RemoteComponent>` stubs that
+        forward calls to the workers, letting cpu bound components run
+        outside of this interpreter. the plugins and the plugins they
+        consume are only imported in the workers.
 
-            self.fire_event(
-                'component_loaded',
-                component,
-                request,
-                plugin + ":" + str(version)
-                )
+        Args:
+            plugins (iterable): names of the plugins to host
+            processes (int, None): number of worker processes,
+                `None` uses the cpu count
+
+        Raises:
+            PyitectError: if the system already hosts plugins
+        """
+        from .workers import ProcessHost
+        if self.process_host is not None:
+            raise PyitectError("System already has a process host")
+        self.process_host = ProcessHost(plugins, processes)
+        return self.process_host
 
-        return self.components[key]
+    def _plan_hosted_load(self, plugin, version, requires=None):
+        """Plan the imports a worker needs to load a plugin
+
+        resolves the plugin's consumed components like
+        :meth:`_load_plugin_obj` would, without importing anything. the
+        dependencies are walked with an explicit stack like
+        :meth:`_load_dependencies` so a long chain doesn't recurse
+
+        Raises:
+            PyitectCycleError: if the plugins consume from each other
+                in a cycle
+        """
+        plan = collections.OrderedDict()
+        # the plugin keys on the current chain and a stack of their
+        # `(cfg, reqs, consumed names left, injections)`
+        chain = []
+        on_chain = set()
+        stack = []
+
+        def push(plugin, version, requires):
+            if (plugin not in self.plugins
+                    or version not in self.plugins[plugin]):
+                raise PyitectError(
+                    "System has no plugin '%s' at version '%s'"
+                    % (plugin, version))
+            cfg = self.plugins[plugin][version]
+            chain.append((plugin, version))
+            on_chain.add((plugin, version))
+            stack.append((
+                cfg, _layer_requires(requires, cfg.consumes),
+                list(cfg.consumes.keys()), {}))
+
+        push(plugin, version, requires)
+        while stack:
+            cfg, reqs, pending, injections = stack[-1]
+            if not pending:
+                stack.pop()
+                plugin_key = chain.pop()
+                on_chain.discard(plugin_key)
+                plan[plugin_key] = (cfg, injections)
+                continue
+            req_name = pending.pop(0)
+            try:
+                comp_name, dep, dep_version, dep_reqs = self._resolve(
+                    req_name, requires=reqs)
+            except Exception as err:
+                raise PyitectLoadError(
+                    "Could not load required component "
+                    "'%s' for plugin '%s@%s'"
+                    % (req_name, cfg.name, cfg.version,),
+                    cause=err)
+            dep_key = (dep, dep_version)
+            comp = self.component_map.get_component(
+                comp_name, dep, dep_version)
+            injections[req_name] = (dep_key, comp.path)
+            if dep_key in plan:
+                continue
+            if dep_key in on_chain:
+                cycle = chain[chain.index(dep_key):] + [dep_key]
+                raise PyitectCycleError(["%s:%s" % key for key in cycle])
+            push(dep, dep_version, dep_reqs)
+        return plan
+
+    def _load_hosted_component(self, comp, requires=None):
+        host = self.process_host
+        plan = self._plan_hosted_load(comp.plugin, comp.version, requires)
+        plan_key, blob = host.make_plan(list(plan.values()))
+        from .workers import RemoteComponent
+        return RemoteComponent(
+            host, comp, plan_key, blob, (comp.plugin, comp.version))
 
     def _load_plugin_obj(self, plugin, version,
                          requires=None, request=None, comp=None):
-        """Loads but does not return a plugin module"""
+        """Loads but does not return a plugin module, timing the load"""
+        plugin_key = (plugin, version)
+        if plugin_key in self._loading:
+            # only lazy imports get here, planned loads catch cycles first
+            cycle = self._loading[self._loading.index(plugin_key):]
+            raise PyitectCycleError(
+                ["%s:%s" % key for key in cycle + [plugin_key]])
+        self._loading.append(plugin_key)
+        # time spent loading nested plugins is added to the top of the stack
+        self._time_stack.append(0.0)
+        start = _clock()
+        try:
+            self._load_plugin_module(plugin, version, requires, request, comp)
+        finally:
+            self._loading.pop()
+            total = _clock() - start
+            nested = self._time_stack.pop()
+            if self._time_stack:
+                self._time_stack[-1] += total
+            if plugin_key in self.loaded_plugins:
+                self.load_profile[plugin_key] = {
+                    "self": total - nested, "total": total}
+
+    def _load_plugin_module(self, plugin, version,
+                            requires=None, request=None, comp=None):
         plugin_key = (plugin, version)
         if (plugin not in self.plugins
                 or version not in self.plugins[plugin]):
@@ -972,37 +2820,32 @@ class System(object):
                 "System has no plugin '%s' at version '%s'"
                 % (plugin, version))
         cfg = self.plugins[plugin][version]
-        # collect the imports namespace object
-        imports = sys.modules[__name__.split('.')[0]].imports
-        # loop through the consumed component names
-        # load them and add them to the imports namespace
-        reqs = {}
-        reqs.update(cfg.consumes)
-        if requires:
-            reqs.update(requires)
-        for req_name in cfg.consumes.keys():
-            obj = None
-            try:
-                obj = self.load(
-                    req_name,
-                    requires=reqs,
-                    request=cfg.get_version_string()
-                    )
-            except Exception as err:
-                raise PyitectLoadError(
-                    "Could not load required component "
-                    "'%s' for plugin '%s@%s'"
-                    % (req_name, plugin, version,),
-                    cause=err)
-
-            setattr(imports, req_name, obj)
+        self._start_prefetches(cfg, requires)
+        reqs = _layer_requires(requires, cfg.consumes)
+        scope = _ImportScope(self, cfg, reqs)
+        budget, deadline = self._get_budget(plugin)
+        consumed = self._consumed_up_front(cfg, reqs)
+        if consumed:
+            # load the plugins providing them, deepest first, so getting
+            # the components below doesn't recurse
+            self._load_dependencies(cfg, reqs)
+        for req_name in consumed:
+            scope.get(req_name)
 
         # load the plugin
-        self.loaded_plugins[plugin_key] = cfg.load()
-
-        # cleanup the imports namespace
-        for req_name in cfg.consumes.keys():
-            delattr(imports, req_name)
+        self._join_prefetch(cfg, deadline)
+        with self.tracer.span(
+                "Plugin._load", plugin=plugin, version=version,
+                request=request):
+            start = _clock()
+            self.loaded_plugins[plugin_key] = self._measure_memory(
+                plugin_key, "load", self._call_with_deadline,
+                cfg, deadline, self._import_plugin, cfg, scope)
+            self._check_budget(cfg, "load", _clock() - start, budget)
+        self._plugin_lru[plugin_key] = None
+        if plugin_key in self._evicted:
+            self._evicted.discard(plugin_key)
+            self.stats["reloads"] += 1
         self.fire_event(
             'plugin_loaded',
             cfg.get_version_string(),
@@ -1010,6 +2853,243 @@ class System(object):
             comp
             )
 
+    def _consumed_up_front(self, cfg, reqs):
+        """The names of the components a plugin consumes that are loaded
+        before it is imported, the rest wait until they are imported
+
+        lazy loads nest a plugin's import in the import that asked for it,
+        past :data:`_MAX_NESTED_LOADS` of them everything is loaded up front
+        so the rest of the chain is loaded by :meth:`_load_dependencies`
+        """
+        # catalogue modules are shared by the objects injected into them
+        # so they need them all up front. an import with a deadline runs on
+        # another thread that can't wait on the system, so it does too
+        eager = (self._get_budget(cfg.name)[1] is not None
+                 or (self.catalogue is not None and self.catalogue.owns(cfg))
+                 or len(self._loading) > _MAX_NESTED_LOADS)
+        if not eager and self.lazy_imports and have_module_getattr:
+            return []
+        # lazy components wait until they are imported if they can
+        return [
+            req_name for req_name in cfg.consumes
+            if eager or not have_module_getattr
+            or not self._is_lazy(req_name, reqs)]
+
+    def _load_dependencies(self, cfg, reqs):
+        """Load the plugins a plugin will consume from before it
+
+        walks the dependencies with an explicit stack and loads each plugin
+        after the plugins it consumes from, so a chain of dependencies
+        doesn't nest loads and is only limited by memory
+
+        Raises:
+            PyitectCycleError: if the plugins consume from each other
+                in a cycle
+        """
+        # the plugins on the current chain and a stack of their
+        # `(load, providers left to walk)`, the root is loaded by the caller
+        chain = [cfg]
+        on_chain = set([(cfg.name, cfg.version)])
+        stack = [(None, self._consumed_providers(cfg, reqs))]
+        while stack:
+            load, pending = stack[-1]
+            if not pending:
+                stack.pop()
+                dep_cfg = chain.pop()
+                on_chain.discard((dep_cfg.name, dep_cfg.version))
+                if load is not None:
+                    plugin, version, requires, request, component = load
+                    try:
+                        self.load_plugin(
+                            plugin, version, requires=requires,
+                            request=request, comp=component)
+                    except PyitectCycleError:
+                        raise
+                    except Exception as err:
+                        raise PyitectLoadError(
+                            "Could not load required component "
+                            "'%s' for plugin '%s'"
+                            % (component, request), cause=err)
+                continue
+            component, plugin, version, dep_reqs = pending.pop()
+            dep_cfg = self.plugins[plugin][version]
+            if (plugin, version) in on_chain:
+                cycle = chain[chain.index(dep_cfg):] + [dep_cfg]
+                raise PyitectCycleError([str(dep) for dep in cycle])
+            if ((plugin, version) in self.loaded_plugins
+                    or (self.process_host is not None
+                        and plugin in self.process_host.plugins)):
+                continue
+            load = (plugin, version, dep_reqs,
+                    chain[-1].get_version_string(), component)
+            chain.append(dep_cfg)
+            on_chain.add((plugin, version))
+            stack.append((load, self._consumed_providers(
+                dep_cfg, _layer_requires(dep_reqs, dep_cfg.consumes))))
+
+    def _consumed_providers(self, cfg, reqs):
+        """Resolve the providers of the components a plugin consumes
+        up front, the ones that can't be resolved are left for the
+        load to report"""
+        providers = []
+        for req_name in reversed(self._consumed_up_front(cfg, reqs)):
+            try:
+                providers.append(self._resolve(req_name, requires=reqs))
+            except PyitectError:
+                continue
+        return providers
+
+    def _get_budget(self, plugin):
+        """returns the `(budget, deadline)` of a plugin in seconds"""
+        budget = self.import_budget
+        deadline = self.import_deadline
+        if plugin in self.plugin_budgets:
+            budget = self.plugin_budgets[plugin].get("budget", budget)
+            deadline = self.plugin_budgets[plugin].get("deadline", deadline)
+        return budget, deadline
+
+    def _check_budget(self, cfg, phase, duration, budget):
+        """Warn about and record a phase of a plugin going over budget"""
+        if budget is None or duration <= budget:
+            return
+        with self._lock:
+            self.stats["budget_violations"] += 1
+            self.budget_violations.append(
+                (cfg.get_version_string(), phase, duration, budget))
+        warnings.warn(
+            "Plugin '%s' took %.3fs in %s, over it's %.3fs budget"
+            % (cfg.get_version_string(), duration, phase, budget),
+            PyitectBudgetWarning)
+
+    def _call_with_deadline(self, cfg, deadline, func, *args):
+        """Call `func` on another thread, giving up on it after `deadline`
+        seconds
+
+        the thread can't be stopped, if it finishes after the deadline the
+        plugin module it imported is unloaded again. until then the plugin
+        isn't imported again, running it's module twice at once
+
+        Raises:
+            PyitectLoadError: if the deadline passed or an earlier import
+                of the plugin that passed it's deadline is still running
+        """
+        if deadline is None:
+            return func(*args)
+        plugin_key = (cfg.name, cfg.version)
+        abandoned_thread = self._deadline_threads.get(plugin_key)
+        if abandoned_thread is not None:
+            if abandoned_thread.is_alive():
+                raise PyitectLoadError(
+                    "Plugin '%s' is still importing after passing it's "
+                    "deadline" % (cfg.get_version_string(),))
+            del self._deadline_threads[plugin_key]
+        outcome = {}
+        lock = threading.Lock()
+
+        def run():
+            try:
+                outcome["result"] = func(*args)
+            except BaseException as err:
+                outcome["error"] = err
+            with lock:
+                outcome["done"] = True
+                abandoned = outcome.get("abandoned", False)
+            if (abandoned and "result" in outcome
+                    and cfg.module is outcome["result"]):
+                cfg.unload()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(deadline)
+        with lock:
+            timed_out = not outcome.get("done", False)
+            outcome["abandoned"] = timed_out
+        if timed_out:
+            self._deadline_threads[plugin_key] = thread
+            self.stats["deadline_aborts"] += 1
+            raise PyitectLoadError(
+                "Plugin '%s' did not finish importing within it's "
+                "%.3fs deadline" % (cfg.get_version_string(), deadline))
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def _is_lazy(self, req_name, reqs):
+        """Is the provider a consumed component resolves to marked lazy?"""
+        if not self._have_lazy_hints:
+            return False
+        try:
+            component, plugin, version, reqs = self._resolve(
+                req_name, requires=reqs)
+        except Exception:
+            # loading it reports the error
+            return False
+        return self.plugins[plugin][version].get_load_hint(component) == "lazy"
+
+    def _load_consumed(self, cfg, req_name, reqs):
+        """Load a component consumed by a plugin, recording the plugin it
+        came from in :attr:`plugin_deps` and :attr:`consumed_providers`"""
+        try:
+            component, plugin, version, reqs = self._resolve(
+                req_name, requires=reqs)
+            with self._lock:
+                self._load_depth += 1
+                try:
+                    obj = self.load_component(
+                        component, plugin, version,
+                        requires=reqs, request=cfg.get_version_string())
+                    consumer = (cfg.name, cfg.version)
+                    if consumer not in self.plugin_deps:
+                        self.plugin_deps[consumer] = set()
+                        self.consumed_providers[consumer] = {}
+                    self.plugin_deps[consumer].add((plugin, version))
+                    self.consumed_providers[consumer][req_name] = (
+                        component, plugin, version)
+                finally:
+                    self._end_load()
+            return obj
+        except PyitectCycleError:
+            raise
+        except Exception as err:
+            raise PyitectLoadError(
+                "Could not load required component "
+                "'%s' for plugin '%s@%s'"
+                % (req_name, cfg.name, cfg.version,),
+                cause=err)
+
+    def _import_plugin(self, cfg, scope):
+        """Import a plugin module with its consumed components available
+        from :mod:`pyitect.imports`, sharing it through the catalogue if
+        the plugin is from one"""
+        owned = self.catalogue is not None and self.catalogue.owns(cfg)
+        if not have_module_getattr:
+            # no __getattr__ to look the components up with,
+            # add them to the imports namespace for the import
+            imports = sys.modules[__name__.split('.')[0]].imports
+            for req_name, obj in scope.values.items():
+                setattr(imports, req_name, obj)
+            try:
+                if owned:
+                    return self.catalogue.load_module(cfg, scope.values)
+                return cfg.load()
+            finally:
+                # cleanup the imports namespace
+                for req_name in scope.values:
+                    delattr(imports, req_name)
+
+        if owned:
+            # the catalogue keeps the scope with its shared module
+            with _pushed_import_scope(scope):
+                return self.catalogue.load_module(cfg, scope.values, scope)
+        # stays with the module so plugins can import consumed components
+        # on demand after the import is done
+        with _pushed_import_scope(scope):
+            module = cfg.load()
+        setattr(module, _SCOPE_ATTR, scope)
+        self._import_scopes[(cfg.name, cfg.version)] = scope
+        return module
+
     def load_plugin(self, plugin, version,
                     requires=None, request=None, comp=None):
         """Takes a plugin name and version and loads it's module
@@ -1052,12 +3132,270 @@ class System(object):
             raise TypeError(
                 "Version must be a SemVer Version, "
                 "got: %r" % (version,))
+        _check_not_prefetching()
         plugin_key = (plugin, version)
-        if plugin_key not in self.loaded_plugins:
-            self._load_plugin_obj(plugin, version, requires, request, comp)
-        plugin_obj = self.loaded_plugins[plugin_key]
+        with self._lock:
+            self._load_depth += 1
+            try:
+                if plugin_key not in self.loaded_plugins:
+                    with self.tracer.span(
+                            "load_plugin", plugin=plugin, version=version,
+                            request=request, component=comp):
+                        self._load_plugin_obj(
+                            plugin, version, requires, request, comp)
+                self._touch_plugin(plugin_key)
+                plugin_obj = self.loaded_plugins[plugin_key]
+                pending = self.pending_on_enables.pop(plugin_key, None)
+            finally:
+                self._end_load()
+        if pending is not None:
+            self._run_on_enable(pending)
         return plugin_obj
 
+    def _start_prefetches(self, cfg, requires):
+        """Queue the plugins a plugin will load that consume nothing,
+        they can be imported on another thread without the system"""
+        if not self.prefetch_workers:
+            return
+        for dep in self._prefetch_candidates(cfg, requires):
+            dep_key = (dep.name, dep.version)
+            with self._prefetch_lock:
+                if dep_key in self._prefetches:
+                    continue
+                if len(self._prefetches) >= self.prefetch_limit:
+                    self.stats["prefetch_skipped"] += 1
+                    continue
+                prefetch = _Prefetch(dep)
+                self._prefetches[dep_key] = prefetch
+                self.stats["prefetches"] += 1
+            if self._prefetch_queue is None:
+                self._prefetch_queue = queue.Queue()
+                system_ref = weakref.ref(self)
+                for i in range(self.prefetch_workers):
+                    thread = threading.Thread(
+                        target=_prefetch_worker,
+                        args=(system_ref, self._prefetch_queue))
+                    thread.daemon = True
+                    thread.start()
+            self._prefetch_queue.put(prefetch)
+
+    def _prefetch_candidates(self, cfg, requires):
+        """Walk the plugins a plugin will load the way :meth:`load` would
+        resolve them and return the ones that can be imported outside the
+        system's lock, see :meth:`_can_import_unlocked`"""
+        found = []
+        seen = set([(cfg.name, cfg.version)])
+        stack = [(cfg, requires)]
+        while stack:
+            cfg, requires = stack.pop()
+            reqs = _layer_requires(requires, cfg.consumes)
+            for req_name in cfg.consumes:
+                try:
+                    component, plugin, version, dep_reqs = self._resolve(
+                        req_name, requires=reqs)
+                except Exception:
+                    # only a guess, the load reports the real error
+                    continue
+                dep_key = (plugin, version)
+                if dep_key in seen or dep_key in self.loaded_plugins:
+                    continue
+                seen.add(dep_key)
+                dep = self.plugins[plugin][version]
+                if dep.get_load_hint(component) == "lazy":
+                    continue
+                if dep.consumes:
+                    stack.append((dep, dep_reqs))
+                elif self._can_import_unlocked(dep):
+                    # budgets, deadlines and memory accounting only
+                    # work on the loading thread
+                    found.append(dep)
+        return found
+
+    def _join_prefetch(self, cfg, deadline):
+        """Wait for a plugin's prefetch, or cancel it if it hasn't started
+
+        Raises:
+            PyitectLoadError: if the prefetch is still importing the plugin
+                when it's deadline passes
+        """
+        plugin_key = (cfg.name, cfg.version)
+        with self._prefetch_lock:
+            prefetch = self._prefetches.pop(plugin_key, None)
+            if prefetch is None:
+                return
+            if prefetch.state == "queued":
+                prefetch.state = "cancelled"
+                self.stats["prefetch_cancelled"] += 1
+                return
+        if not prefetch.done.wait(deadline):
+            with self._prefetch_lock:
+                timed_out = not prefetch.done.is_set()
+                if timed_out and prefetch.state == "running":
+                    # the prefetch thread unloads it when it's done
+                    prefetch.state = "abandoned"
+            if timed_out:
+                # not imported again until the prefetch is done
+                self._deadline_threads[plugin_key] = prefetch
+                self.stats["deadline_aborts"] += 1
+                raise PyitectLoadError(
+                    "Plugin '%s' did not finish importing within it's "
+                    "%.3fs deadline" % (cfg.get_version_string(), deadline))
+        if prefetch.state == "preloading":
+            return
+        with self._prefetch_lock:
+            if prefetch.error is None:
+                self.stats["prefetch_hits"] += 1
+            else:
+                # the load imports it again and reports the error
+                self.stats["prefetch_errors"] += 1
+
+    def _stop_prefetching(self):
+        """Stop the prefetch threads and count the unused prefetches"""
+        if self._prefetch_queue is not None:
+            for i in range(self.prefetch_workers):
+                self._prefetch_queue.put(None)
+            self._prefetch_queue = None
+        with self._prefetch_lock:
+            prefetches = list(self._prefetches.values())
+            self._prefetches.clear()
+            for prefetch in prefetches:
+                if prefetch.state == "queued":
+                    prefetch.state = "cancelled"
+                elif prefetch.state != "running":
+                    continue
+                elif not prefetch.done.is_set():
+                    # not waited for, the thread unloads it when it's done
+                    prefetch.state = "abandoned"
+                elif prefetch.error is None:
+                    self.stats["prefetch_wasted"] += 1
+
+    def _touch_plugin(self, plugin_key):
+        """Mark a loaded plugin as the most recently used"""
+        if plugin_key in self._plugin_lru:
+            del self._plugin_lru[plugin_key]
+            self._plugin_lru[plugin_key] = None
+
+    def _end_load(self):
+        """Leave a load, evicting plugins once the outermost load is done
+        so nothing is evicted while it's still being imported"""
+        self._load_depth -= 1
+        if not self._load_depth:
+            self._evict_plugins()
+
+    def _over_capacity(self):
+        if (self.max_loaded_plugins is not None
+                and len(self.loaded_plugins) > self.max_loaded_plugins):
+            return True
+        if self.max_loaded_memory is not None and self._track_memory:
+            used = 0
+            for plugin_key in self.loaded_plugins:
+                memory = self.plugin_memory.get(plugin_key)
+                if memory is not None:
+                    used += memory["load"] + memory["on_enable"]
+            return used > self.max_loaded_memory
+        return False
+
+    def _is_pinned(self, plugin_key):
+        """Can a loaded plugin not be evicted?
+
+        plugins still consumed by a loaded plugin, plugins with an
+        `on_enable` hook, which isn't run again on reload, and plugins whose
+        modules are shared through a catalogue are pinned
+        """
+        cfg = self.plugins[plugin_key[0]][plugin_key[1]]
+        if cfg.has_on_enable():
+            return True
+        if self.catalogue is not None and self.catalogue.owns(cfg):
+            return True
+        for consumer, deps in self.plugin_deps.items():
+            if plugin_key in deps and consumer in self.loaded_plugins:
+                return True
+        return False
+
+    def _evict_plugins(self):
+        """Evict least recently used plugins until the system is back
+        under its capacity, the most recently used plugin is always kept"""
+        if not self._over_capacity():
+            return
+        candidates = list(self._plugin_lru)[:-1]
+        # evicting a plugin can unpin the plugins it consumed so keep
+        # going over the candidates until nothing more can be evicted
+        evicted = True
+        while evicted and candidates:
+            evicted = False
+            for plugin_key in list(candidates):
+                if not self._over_capacity():
+                    return
+                if not self._is_pinned(plugin_key):
+                    candidates.remove(plugin_key)
+                    self.evict_plugin(*plugin_key)
+                    evicted = True
+
+    def evict_plugin(self, plugin, version):
+        """Unload a plugin and forget it's loaded components
+
+        the plugin is imported again the next time one of it's components
+        is loaded. components already handed out keep working, the system
+        just stops holding on to them.
+
+        Args:
+            plugin (str): plugin name
+            version (str, Version): plugin version
+        """
+        if isinstance(version, basestring):
+            version = gen_version(version)
+        plugin_key = (plugin, version)
+        with self._lock:
+            if plugin_key not in self.loaded_plugins:
+                return
+            cfg = self.plugins[plugin][version]
+            del self.loaded_plugins[plugin_key]
+            self._plugin_lru.pop(plugin_key, None)
+            self.plugin_deps.pop(plugin_key, None)
+            self.consumed_providers.pop(plugin_key, None)
+            self.plugin_memory.pop(plugin_key, None)
+            for key in list(self.components):
+                if key[1] == plugin and key[3] == version:
+                    del self.components[key]
+            if self.catalogue is None or not self.catalogue.owns(cfg):
+                scope = self._import_scopes.pop(plugin_key, None)
+                if scope is not None:
+                    scope.close()
+                cfg.unload()
+            self._evicted.add(plugin_key)
+            self.stats["evictions"] += 1
+            # only handles to the plugin's components hold stale objects
+            for handle in list(self.handles):
+                if handle._plugin_key == plugin_key:
+                    handle.invalidate()
+        self.fire_event('plugin_evicted', cfg.get_version_string())
+
+    def handle(self, component, requires=None, bypass=False,
+               subs=True, key=None, reverse=False):
+        """Get a reusable handle to a component
+
+        the handle loads the component with :meth:`load` on first use and
+        then returns the same object until the system's providers change,
+        that is when plugins are enabled, the plugin the component came
+        from is evicted, the config is replaced or the system is closed.
+        takes the same arguments as :meth:`load`
+
+        Returns:
+            ComponentHandle: the handle
+        """
+        handle = ComponentHandle(
+            self, component, requires=requires, bypass=bypass,
+            subs=subs, key=key, reverse=reverse)
+        with self._lock:
+            self.handles.add(handle)
+        return handle
+
+    def invalidate_handles(self):
+        """Make every handle resolve it's component again on next use"""
+        with self._lock:
+            for handle in list(self.handles):
+                handle.invalidate()
+
     def resolve_providers(self, component, subs=True, key=None, reverse=False):
         """Resolve what avalible component is used
 
@@ -1071,9 +3409,10 @@ class System(object):
             key(func, None): a key function to sort the componet types and
                 subtypes that are valid so you can select the correct one
         """
-        provs = sorted(
-            self.iter_component_providers(component, subs=subs),
-            key=key, reverse=reverse)
+        with self.tracer.span("resolve_providers", component=component):
+            provs = sorted(
+                self.iter_component_providers(component, subs=subs),
+                key=key, reverse=reverse)
         if len(provs) < 1:
             raise PyitectNotProvidedError(
                 "Component '%s' not provided by any enabled plugins"
@@ -1123,20 +3462,39 @@ class System(object):
             TypeError: if thigns get passed worng
             PyitectLoadError: if there is an exception druing load
         """
+        component, plugin, version, reqs = self._resolve(
+            component, requires, bypass, subs, key, reverse)
+
+        comp_obj = self.load_component(
+            component, plugin, version, requires=reqs, request=request)
+
+        return comp_obj
+
+    def _resolve(self, component, requires=None, bypass=False,
+                 subs=True, key=None, reverse=False):
+        """Resolve the provider :meth:`load` would load a component from
+
+        Returns:
+            tuple: `(component, plugin, version, reqs)` where `reqs` is the
+            layered requirements mapping to load the component with
+        """
         # set default requirements
         plugin = version = plugin_req = ""
         version_spec = Spec("*")
         component, plugin, version = self.resolve_providers(
             component, subs=subs, key=key, reverse=reverse)
 
-        # merge the systems config and the passed plugin requirements (if they
-        # were passed) to get the most relavent requirements
-        reqs = {}
-
-        if not bypass:
-            reqs.update(self.config)
-        if requires is not None:
-            reqs.update(requires)
+        # layer the passed plugin requirements (if they were passed) over
+        # the systems config to get the most relavent requirements
+        if bypass:
+            reqs = {} if requires is None else requires
+        elif requires is None:
+            reqs = self.config
+        elif _layered_over(requires, self.config):
+            # the config is in there already
+            reqs = requires
+        else:
+            reqs = _Requires(requires, self.config)
 
         # update the plugin and version requirements if they exist
         if component in reqs:
@@ -1146,10 +3504,252 @@ class System(object):
             plugin, version = self.resolve_highest_match(
                 component, plugin_req, version_spec)
 
-        comp_obj = self.load_component(
-            component, plugin, version, requires=reqs)
+        return component, plugin, version, reqs
 
-        return comp_obj
+    def _measure_memory(self, plugin_key, phase, func, *args):
+        """Call `func` and charge the memory it allocates to a plugin
+
+        allocations made by nested plugin loads are charged to the nested
+        plugin, not to the one that triggered them
+        """
+        if not self._track_memory:
+            return func(*args)
+        if not hasattr(self._memory_local, "stack"):
+            self._memory_local.stack = []
+        stack = self._memory_local.stack
+        stack.append(0)
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            return func(*args)
+        finally:
+            growth = tracemalloc.get_traced_memory()[0] - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += growth
+            with self._lock:
+                if plugin_key not in self.plugin_memory:
+                    self.plugin_memory[plugin_key] = {
+                        "load": 0, "on_enable": 0}
+                self.plugin_memory[plugin_key][phase] += growth - nested
+
+    def load_graph(self):
+        """Build the dependency graph of the plugins loaded so far
+
+        Returns:
+            LoadGraph: the graph with the timings from :attr:`load_profile`
+            and the edges from :attr:`plugin_deps`
+        """
+        def name(plugin_key):
+            return "%s:%s" % plugin_key
+
+        with self._lock:
+            times = dict(
+                (name(plugin_key), (timing["self"], timing["total"]))
+                for plugin_key, timing in self.load_profile.items())
+            edges = dict(
+                (name(plugin_key), set(name(dep) for dep in deps))
+                for plugin_key, deps in self.plugin_deps.items()
+                if name(plugin_key) in times)
+        return LoadGraph(times, edges)
+
+    def save_profile(self, path):
+        """Save the components the system loaded for :meth:`preload`
+
+        the profile is a JSON file with the `(component, plugin, version)`
+        of every component in :attr:`using` and the plugins each loaded
+        plugin consumed from
+
+        Args:
+            path (str): the file to write
+        """
+        with self._lock:
+            components = []
+            seen = set()
+            for key in self.using:
+                entry = [key[0], key[1], str(key[3])]
+                if tuple(entry) not in seen:
+                    seen.add(tuple(entry))
+                    components.append(entry)
+            plugins = [
+                {"plugin": plugin_key[0], "version": str(plugin_key[1]),
+                 "consumes": sorted(
+                     [dep[0], str(dep[1])] for dep in deps)}
+                for plugin_key, deps in sorted(self.plugin_deps.items())]
+        with open(path, "w") as f:
+            json.dump(
+                {"components": components, "plugins": plugins},
+                f, indent=2, sort_keys=True)
+
+    def preload(self, path, workers=4):
+        """Load the components in a profile saved by :meth:`save_profile`
+
+        call it at startup before the components are needed. the profile's
+        plugins are loaded in dependency order on `workers` threads, plugins
+        that consume nothing are imported at the same time as each other
+        and as the other loads. entries the system can't provide any more
+        are skipped and left to normal resolution, components are loaded
+        with the system's config
+
+        Args:
+            path (str): the profile file
+            workers (int): number of threads loading plugins
+
+        Returns:
+            dict: `loaded` is the sorted version strings of the plugins
+            loaded, `skipped` the `[component, plugin, version]` entries
+            skipped and `errors` `(entry, error)` tuples of the entries
+            that failed to load
+
+        Raises:
+            PyitectError: if the profile can't be read
+        """
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+        except Exception as err:
+            raise PyitectError(
+                "Could not read load profile at %s" % (path,), cause=err)
+
+        def available(plugin, version):
+            return (plugin in self.plugins
+                    and version in self.plugins[plugin]
+                    and (plugin, version) in self._enabled_keys)
+
+        entries = []
+        skipped = []
+        for name, plugin, version in profile.get("components", ()):
+            version = gen_version(version)
+            if (available(plugin, version) and self.component_map
+                    .get_component(name, plugin, version) is not None):
+                entries.append((name, plugin, version))
+            else:
+                skipped.append([name, plugin, str(version)])
+        deps = {}
+        for entry in profile.get("plugins", ()):
+            plugin_key = (entry["plugin"], gen_version(entry["version"]))
+            deps[plugin_key] = set(
+                (dep, gen_version(dep_version))
+                for dep, dep_version in entry["consumes"]
+                if available(dep, gen_version(dep_version)))
+        # plugins in the profile and the plugins they consumed from
+        keys = set((plugin, version) for name, plugin, version in entries)
+        stack = list(keys)
+        while stack:
+            for dep_key in deps.get(stack.pop(), ()):
+                if dep_key not in keys:
+                    keys.add(dep_key)
+                    stack.append(dep_key)
+        keys = sorted(key for key in keys if key not in self.loaded_plugins)
+
+        def load(plugin_key):
+            cfg = self.plugins[plugin_key[0]][plugin_key[1]]
+            claim = None
+            if self._can_import_unlocked(cfg):
+                # nothing to inject, import it without holding the system.
+                # it's claimed like a prefetch so loads on other threads
+                # wait for it instead of importing it too, a load holding
+                # the system when it's claimed has already imported it
+                with self._lock:
+                    with self._prefetch_lock:
+                        if (cfg.module is None
+                                and plugin_key not in self._prefetches):
+                            claim = _Prefetch(cfg)
+                            claim.state = "preloading"
+                            self._prefetches[plugin_key] = claim
+            if claim is not None:
+                try:
+                    cfg.load()
+                except Exception as err:
+                    # the load imports it again and reports the error
+                    claim.error = err
+                finally:
+                    claim.done.set()
+            self.load_plugin(
+                cfg.name, cfg.version, requires=self.config,
+                request="preload")
+
+        errors = []
+        with self.tracer.span("preload", path=path, plugins=len(keys)):
+            results = _run_ordered(keys, deps, load, workers)
+            for plugin_key, (duration, error) in results:
+                if error is not None:
+                    errors.append(
+                        ([plugin_key[0], str(plugin_key[1])], error))
+            for name, plugin, version in entries:
+                try:
+                    self.load_component(
+                        name, plugin, version, requires=self.config,
+                        request="preload")
+                except PyitectError as err:
+                    errors.append(([name, plugin, str(version)], err))
+        return {
+            "loaded": sorted(
+                "%s:%s" % plugin_key for plugin_key in keys
+                if plugin_key in self.loaded_plugins),
+            "skipped": skipped,
+            "errors": errors,
+        }
+
+    def _can_import_unlocked(self, cfg):
+        """Can a plugin be imported outside the system's lock?
+
+        only plugins that consume nothing, are loaded in this process
+        without a budget, deadline or memory tracking and don't share a
+        catalogue module can
+        """
+        return (not cfg.consumes and cfg.module is None
+                and self._get_budget(cfg.name) == (None, None)
+                and not self._track_memory
+                and (self.process_host is None
+                     or cfg.name not in self.process_host.plugins)
+                and (self.catalogue is None or not self.catalogue.owns(cfg)))
+
+    def registry_memory(self):
+        """Measure the memory retained by the system's own registries
+
+        counts the containers, keys and metadata objects of
+        :attr:`plugins`, :attr:`component_map` and :attr:`components`,
+        not the plugin modules or the loaded component objects themselves
+
+        Returns:
+            dict: registry attribute names mapped to sizes in bytes
+        """
+        return dict(
+            (name, _registry_sizeof(getattr(self, name)))
+            for name in ("plugins", "component_map", "components"))
+
+    def memory_report(self):
+        """Report the memory cost of plugins and registries
+
+        plugin entries are only present if the system was created with
+        `track_memory` enabled
+
+        Returns:
+            list: tuples of `(name, kind, size)` sorted by size, largest
+            first. `kind` is either `"plugin"` or `"registry"`, `name` is a
+            plugin version string or a registry attribute name and `size`
+            is in bytes
+        """
+        report = []
+        for (name, version), usage in self.plugin_memory.items():
+            report.append((
+                name + ":" + str(version),
+                "plugin",
+                usage["load"] + usage["on_enable"]))
+        for name, size in self.registry_memory().items():
+            report.append((name, "registry", size))
+        return sorted(report, key=lambda entry: entry[2], reverse=True)
+
+    def call_report(self):
+        """Report the call statistics of instrumented components
+
+        Returns:
+            list: :class:`ComponentStats` sorted by the total time spent in
+            calls, largest first
+        """
+        return sorted(
+            self.call_stats.values(),
+            key=lambda stats: stats.total_time, reverse=True)
 
     def get_plugin_module(self, plugin, version=None):
         """Fetch the loaded plugin module
@@ -1244,7 +3844,7 @@ def expand_version_req(requires):
             return (parts[0], Spec(parts[1]))
         else:
             return (requires,  Spec("*"))
-    elif isinstance(requires, collections.Mapping):
+    elif isinstance(requires, Mapping):
         if "plugin" not in requires:
             raise ValueError(
                 "Version requirements mappings must contain a 'plugin' key")
@@ -1300,6 +3900,398 @@ def get_unique_name(*parts):
     return str(name_hash.hexdigest())
 
 
+class _Requires(Mapping):
+    """Requirements layered under other requirements without copying
+    them, `upper` wins over `lower`
+
+    a plugin's requirements are the ones of the plugins that led to it's
+    load layered over the ones it consumes with, so they are chains of
+    these as long as the chain of plugins. lookups walk the chain without
+    recursing
+    """
+
+    __slots__ = ("upper", "lower")
+
+    def __init__(self, upper, lower):
+        self.upper = upper
+        self.lower = lower
+
+    def _layers(self):
+        """returns the layers, the winning ones first"""
+        layers = []
+        reqs = self
+        while isinstance(reqs, _Requires):
+            layers.append(reqs.lower)
+            reqs = reqs.upper
+        layers.append(reqs)
+        layers.reverse()
+        return layers
+
+    def __getitem__(self, name):
+        found = _UNRESOLVED
+        reqs = self
+        while isinstance(reqs, _Requires):
+            if name in reqs.lower:
+                found = reqs.lower[name]
+            reqs = reqs.upper
+        if name in reqs:
+            return reqs[name]
+        if found is _UNRESOLVED:
+            raise KeyError(name)
+        return found
+
+    def __contains__(self, name):
+        reqs = self
+        while isinstance(reqs, _Requires):
+            if name in reqs.lower:
+                return True
+            reqs = reqs.upper
+        return name in reqs
+
+    def __iter__(self):
+        seen = set()
+        for layer in self._layers():
+            for name in layer:
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+    def __len__(self):
+        return sum(1 for name in self)
+
+
+def _layer_requires(requires, consumes):
+    """A plugin's requirements, the ones it was loaded with over the ones
+    it consumes with"""
+    if requires is None:
+        return consumes
+    return _Requires(requires, consumes)
+
+
+def _layered_over(reqs, base):
+    """Is `base` one of the layers of `reqs`?"""
+    while isinstance(reqs, _Requires):
+        if reqs.lower is base:
+            return True
+        reqs = reqs.upper
+    return reqs is base
+
+
+class _ImportScope(object):
+    """The consumed components a plugin module can import
+    from :mod:`pyitect.imports`
+
+    components are loaded the first time they are asked for
+    """
+
+    def __init__(self, system, cfg, reqs):
+        self._system = weakref.ref(system)
+        self.cfg = cfg
+        self.reqs = reqs
+        self.values = {}
+        self.closed = False
+
+    def provides(self, name):
+        return not self.closed and name in self.cfg.consumes
+
+    def close(self):
+        """Stop providing components, the plugin was unloaded"""
+        self.closed = True
+
+    def get(self, name):
+        if name not in self.values:
+            system = self._system()
+            if system is None:
+                raise PyitectLoadError(
+                    "Plugin '%s' can't import '%s', its system is gone"
+                    % (self.cfg.get_version_string(), name))
+            self.values[name] = system._load_consumed(
+                self.cfg, name, self.reqs)
+        return self.values[name]
+
+
+def _top_import_scope():
+    """returns the scope of the plugin the current thread is importing,
+    `None` if it isn't importing one"""
+    stack = getattr(_import_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+class _pushed_import_scope(object):
+    """Context manager making a scope the current thread's
+    fallback :mod:`pyitect.imports` scope"""
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    def __enter__(self):
+        if not hasattr(_import_local, "stack"):
+            _import_local.stack = []
+        _import_local.stack.append(self.scope)
+
+    def __exit__(self, *exc_info):
+        _import_local.stack.pop()
+
+
+class _PluginFinder(object):
+    """A `sys.meta_path` finder for the top level modules beside a plugin
+
+    only answers while a plugin module is executing on the current thread,
+    looking in that plugin's folder. stands in for putting the plugin
+    folder on `sys.path` during the import
+    """
+
+    @classmethod
+    def find_spec(cls, fullname, path=None, target=None):
+        dirs = getattr(_plugin_dir_local, "dirs", None)
+        if not dirs or path is not None:
+            return None
+        return importlib.machinery.PathFinder.find_spec(fullname, dirs[-1:])
+
+    @classmethod
+    def invalidate_caches(cls):
+        pass
+
+
+def _drop_modules(name, folder):
+    """Remove a plugin module, it's submodules and the modules loaded from
+    it's folder from `sys.modules`"""
+    prefix = name + "."
+    folder = os.path.join(os.path.abspath(folder), "") if folder else None
+    for mod_name, module in list(sys.modules.items()):
+        if mod_name == name or mod_name.startswith(prefix):
+            del sys.modules[mod_name]
+            continue
+        mod_file = getattr(module, "__file__", None)
+        if (folder is not None and isinstance(mod_file, basestring)
+                and os.path.abspath(mod_file).startswith(folder)):
+            del sys.modules[mod_name]
+
+
+def _install_plugin_finder():
+    global _plugin_finder
+    if _plugin_finder is None:
+        _plugin_finder = _PluginFinder
+        # just ahead of the path finder, like the plugin folder used to be
+        # at the front of sys.path. builtin and frozen modules still come
+        # first so plugin files can't shadow them
+        for index, finder in enumerate(sys.meta_path):
+            if finder is importlib.machinery.PathFinder:
+                sys.meta_path.insert(index, _plugin_finder)
+                break
+        else:
+            sys.meta_path.append(_plugin_finder)
+
+
+def _import_lookup(name, frame):
+    """Look up a consumed component for :mod:`pyitect.imports`
+
+    the scope is found in the importing module's globals, or it's package's
+    for a submodule, falling back to the plugin the current thread is
+    importing
+
+    Raises:
+        AttributeError: if the importer doesn't consume the name
+    """
+    scope = None
+    module_name = None
+    if frame is not None:
+        scope = frame.f_globals.get(_SCOPE_ATTR)
+        module_name = frame.f_globals.get("__name__")
+    # submodules of a package plugin use the package's scope
+    while scope is None and module_name and "." in module_name:
+        module_name = module_name.rpartition(".")[0]
+        scope = getattr(sys.modules.get(module_name), _SCOPE_ATTR, None)
+    if scope is None:
+        scope = _top_import_scope()
+    if scope is None or not scope.provides(name):
+        raise AttributeError(
+            "module 'pyitect.imports' has no attribute '%s'" % (name,))
+    return scope.get(name)
+
+
+class _Prefetch(object):
+    """A plugin import queued on the prefetch threads, or one
+    :meth:`System.preload` is doing outside the system's lock"""
+
+    __slots__ = ("plugin", "state", "done", "error")
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+        self.state = "queued"
+        self.done = threading.Event()
+        self.error = None
+
+    def is_alive(self):
+        """Is the plugin still being imported? matches
+        :class:`threading.Thread` so a prefetch that passed it's deadline
+        can wait in :attr:`System._deadline_threads`"""
+        return not self.done.is_set()
+
+
+def _prefetch_worker(system_ref, work):
+    """Import queued plugins until a `None` is queued or the
+    system is gone, only holds the system while taking a prefetch"""
+    while True:
+        prefetch = work.get()
+        if prefetch is None:
+            return
+        system = system_ref()
+        if system is None:
+            return
+        with system._prefetch_lock:
+            cancelled = prefetch.state != "queued"
+            if not cancelled:
+                prefetch.state = "running"
+        del system
+        if cancelled:
+            continue
+        _prefetch_local.active = True
+        try:
+            prefetch.plugin.load()
+        except Exception as err:
+            prefetch.error = err
+        finally:
+            _prefetch_local.active = False
+            system = system_ref()
+            abandoned = system is None
+            if system is not None:
+                with system._prefetch_lock:
+                    abandoned = prefetch.state == "abandoned"
+                    if not abandoned:
+                        prefetch.done.set()
+                del system
+            if abandoned:
+                # the system stopped prefetching without waiting for it
+                if prefetch.error is None:
+                    prefetch.plugin.unload()
+                prefetch.done.set()
+
+
+def _check_not_prefetching():
+    """Refuse loads from a plugin being prefetched
+
+    the loading thread can be waiting on the prefetch while holding the
+    system's lock, letting the prefetch wait on the lock would deadlock.
+    the prefetch fails instead and the plugin is loaded normally
+    """
+    if getattr(_prefetch_local, "active", False):
+        raise PyitectLoadError(
+            "A plugin being prefetched can't load components")
+
+
+def _run_ordered(keys, deps, func, workers):
+    """Call `func(key)` for every key on up to `workers` threads
+
+    a key is only started once all the keys it depends on have finished,
+    successfully or not. keys stuck in a dependency cycle fail with a
+    :class:`PyitectError` without being started.
+
+    Args:
+        keys (list): the keys to run
+        deps (dict): keys mapped to the keys they depend on
+        func (callable): called with each key
+        workers (int): the maximum number of calls to run at once
+
+    Returns:
+        list: `(key, (duration, error))` tuples in the order the calls
+        finished, `error` is the exception raised or `None`
+    """
+    keyset = set(keys)
+    waiting = dict(
+        (key, set(dep for dep in deps.get(key, ()) if dep in keyset))
+        for key in keys)
+    ready = [key for key in keys if not waiting[key]]
+    for key in ready:
+        del waiting[key]
+    results = []
+    running = [0]
+    cond = threading.Condition()
+
+    def work():
+        while True:
+            with cond:
+                while not ready and running[0] and waiting:
+                    cond.wait()
+                if not ready:
+                    if not running[0] and waiting:
+                        # nothing left to run can unblock these
+                        for key in list(waiting.keys()):
+                            results.append((key, (0.0, PyitectError(
+                                "'%s' is part of a dependency cycle"
+                                % (key,)))))
+                        waiting.clear()
+                        cond.notify_all()
+                    return
+                key = ready.pop(0)
+                running[0] += 1
+            error = None
+            start = _clock()
+            try:
+                func(key)
+            except Exception as err:
+                error = err
+            duration = _clock() - start
+            with cond:
+                running[0] -= 1
+                results.append((key, (duration, error)))
+                for other in list(waiting.keys()):
+                    waiting[other].discard(key)
+                    if not waiting[other]:
+                        del waiting[other]
+                        ready.append(other)
+                cond.notify_all()
+
+    threads = [
+        threading.Thread(target=work)
+        for i in range(max(1, min(workers, len(keys))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _registry_sizeof(obj, seen=None):
+    """Deep `sys.getsizeof` of a registry object
+
+    descends into builtin containers and pyitect's metadata objects
+    but not into anything else, module and component objects belong
+    to their plugins
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (basestring, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size = sys.getsizeof(obj)
+        for key, value in obj.items():
+            size += _registry_sizeof(key, seen)
+            size += _registry_sizeof(value, seen)
+        return size
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        size = sys.getsizeof(obj)
+        for item in obj:
+            size += _registry_sizeof(item, seen)
+        return size
+    if isinstance(obj, array.array):
+        return sys.getsizeof(obj)
+    if isinstance(obj, (Plugin, Component, Version, CompactComponentMap)):
+        size = sys.getsizeof(obj)
+        if hasattr(obj, "__dict__"):
+            size += sys.getsizeof(obj.__dict__)
+            for name, value in obj.__dict__.items():
+                # the module is owned by the plugin not the registry
+                if name != "module":
+                    size += _registry_sizeof(value, seen)
+        return size
+    return 0
+
+
 def issubcomponent(comp1, comp2):
     """Check if comp1 is a subtype of comp2
 
@@ -1417,12 +4409,34 @@ class PyitectLoadError(PyitectError):
         super(PyitectLoadError, self).__init__(*args, **kwargs)
 
 
+class PyitectCycleError(PyitectLoadError):
+    """Raised if plugins consume from each other in a cycle
+
+    it is passed on as it is by the loads and imports it goes through
+
+    Attributes:
+        cycle (list): the version strings of the plugins in the cycle,
+            the first one repeated at the end
+    """
+    def __init__(self, cycle, *args, **kwargs):
+        self.cycle = cycle
+        super(PyitectCycleError, self).__init__(
+            "Plugins consume from each other in a cycle: %s"
+            % (" -> ".join(cycle),), *args, **kwargs)
+
+
 class PyitectOnEnableError(PyitectError):
     """Raised if and on_enable call failes"""
     def __init__(self, *args, **kwargs):
         super(PyitectOnEnableError, self).__init__(*args, **kwargs)
 
 
+class PyitectBudgetWarning(RuntimeWarning):
+    """
+    Warns that a plugin's import or `on_enable` took longer than it's budget
+    """
+
+
 class PyitectDupError(PyitectError):
     """
     Raised if you try to add a duplicate plugin or duplicate component provider
@@ -0,0 +1,361 @@
+"""
+Fetches plugin bundles from a remote repository into a local cache
+
+A repository is any HTTP (or `file:`) location serving an `index.json` and
+the plugin bundles it lists. A bundle is a zip archive holding a plugin
+folder, the folder named after the plugin with the plugin's config file in
+it, just like a plugin folder on disk. The index looks like this::
+
+    {
+        "plugins": {
+            "html_renderer": {
+                "2.1.0": {
+                    "url": "bundles/html_renderer-2.1.0.zip",
+                    "sha256": "<hex digest of the bundle>",
+                    "provides": ["renderer.html"],
+                    "consumes": {"markdown": "markdown_plugin:>=1.0"}
+                }
+            }
+        }
+    }
+
+bundle urls are relative to the index. `provides` and `consumes` are
+optional, they let the repository pick providers for components and follow
+the dependencies of the plugins it fetches.
+
+The cache is content addressed, a bundle is stored and unpacked under the
+sha256 of it's bytes. Entries are written to temporary names and renamed
+into place so processes can share a cache directory.
+"""
+from __future__ import (print_function)
+
+import os
+import json
+import errno
+import socket
+import shutil
+import hashlib
+import tempfile
+import warnings
+import zipfile
+
+try:
+    from urllib.request import urlopen
+    from urllib.parse import urljoin
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import urlopen, URLError
+    from urlparse import urljoin
+
+from semantic_version import Version
+
+from .pyitect import (
+    PyitectError, PyitectNotProvidedError, PyitectDupError,
+    expand_version_req, _run_ordered)
+
+
+class Repository(object):
+    """A remote plugin repository with a local cache
+
+    Attributes:
+        url (str): url of the repository's `index.json`
+        cache_dir (str): directory of the local cache
+        workers (int): number of bundles downloaded at once
+        timeout (float): seconds to wait on the repository
+        index (dict, None): the last index read, `None` until
+            :meth:`fetch_index` is called
+        offline (bool): was the last index read from the cache because the
+            repository couldn't be reached?
+    """
+
+    def __init__(self, url, cache_dir, workers=4, timeout=10):
+        """Init the repository, nothing is fetched yet
+
+        Args:
+            url (str): url of the repository's `index.json`
+            cache_dir (str): directory of the local cache, created if missing
+            workers (int): number of bundles to download at once
+            timeout (float): seconds to wait on the repository
+        """
+        self.url = url
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.timeout = timeout
+        self.index = None
+        self.offline = False
+        _makedirs(cache_dir)
+
+    def _index_path(self):
+        key = hashlib.sha256(self.url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "index-%s.json" % (key,))
+
+    def fetch_index(self):
+        """Fetch the index, falling back to the cached copy
+
+        Returns:
+            dict: the index
+
+        Raises:
+            PyitectError: if the repository can't be reached and
+                there is no cached index
+        """
+        try:
+            data = _read_url(self.url, self.timeout)
+            index = json.loads(data.decode("utf-8"))
+        except (URLError, socket.error, ValueError) as err:
+            if not os.path.exists(self._index_path()):
+                raise PyitectError(
+                    "Repository '%s' is unreachable and has no cached index"
+                    % (self.url,), cause=err)
+            with open(self._index_path()) as f:
+                index = json.load(f)
+            self.offline = True
+        else:
+            _write_atomic(self._index_path(), data)
+            self.offline = False
+        self.index = index
+        return index
+
+    def select(self, config, system=None):
+        """Pick the plugin versions a system config needs
+
+        every requirement in the config selects the highest matching version
+        of it's plugin, or of the providers of the component if the
+        requirement doesn't name a plugin. the consumed components of the
+        selected plugins are followed the same way, config requirements
+        taking precedence. consumed components the repository has no
+        provider for are left to the system's other plugins.
+        index versions that aren't semantic versions are coerced into one,
+        entries that can't be are skipped with a warning
+
+        Args:
+            config (dict): A mapping of component names to version
+                requirements, like a :class:`System <pyitect.System>` config
+            system (System, None): a system whose plugins are used first,
+                requirements it's plugins can meet are skipped
+
+        Returns:
+            dict: `(name, version string)` tuples mapped to index entries,
+            the version strings as they are in the index
+
+        Raises:
+            PyitectNotProvidedError: if a requirement can't be met
+        """
+        if self.index is None:
+            self.fetch_index()
+        plugins = self.index.get("plugins", {})
+        selected = {}
+        pending = [
+            (component, requires, True)
+            for component, requires in config.items()]
+        while pending:
+            component, requires, required = pending.pop()
+            if component in config:
+                requires = config[component]
+            plugin_req, spec = expand_version_req(requires)
+            if system is not None and _provides_locally(
+                    system, component, plugin_req, spec):
+                continue
+            if plugin_req:
+                names = [plugin_req]
+            else:
+                names = [
+                    name for name in sorted(plugins)
+                    if any(component in entry.get("provides", ())
+                           for entry in plugins[name].values())]
+            found = None
+            for name in names:
+                versions = {}
+                for version, entry in plugins.get(name, {}).items():
+                    if plugin_req or component in entry.get("provides", ()):
+                        parsed = self._parse_version(name, version)
+                        if parsed is not None:
+                            versions[parsed] = version
+                version = spec.select(list(versions))
+                if version is not None and (
+                        found is None or version > found[1]):
+                    found = (name, version, versions[version])
+            if found is None:
+                if not required:
+                    continue
+                raise PyitectNotProvidedError(
+                    "Repository '%s' has no plugin for '%s' matching '%s'"
+                    % (self.url, component, requires))
+            key = (found[0], found[2])
+            if key not in selected:
+                selected[key] = plugins[key[0]][key[1]]
+                pending.extend(
+                    (consumed, consumed_requires, False)
+                    for consumed, consumed_requires
+                    in selected[key].get("consumes", {}).items())
+        return selected
+
+    def _parse_version(self, name, version):
+        """returns an index version as a :class:`Version`, `None` and a
+        warning if it can't be read"""
+        try:
+            return Version.coerce(version)
+        except ValueError:
+            warnings.warn(
+                "Repository '%s' lists plugin '%s' with a bad version '%s',"
+                " skipping it" % (self.url, name, version))
+            return None
+
+    def bundle_path(self, digest):
+        """returns the folder a bundle is unpacked to in the cache"""
+        return os.path.join(self.cache_dir, "plugins", digest)
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def fetch_bundle(self, name, version, entry):
+        """Download, verify and unpack a bundle unless it is cached
+
+        Returns:
+            str: path to the unpacked plugin folder
+
+        Raises:
+            PyitectError: if the bundle can't be fetched or doesn't
+                match it's hash
+        """
+        digest = entry["sha256"].lower()
+        folder = os.path.join(self.bundle_path(digest), name)
+        if os.path.isdir(folder):
+            return folder
+        obj_path = self._object_path(digest)
+        if not os.path.exists(obj_path):
+            try:
+                data = _read_url(
+                    urljoin(self.url, entry["url"]), self.timeout)
+            except (URLError, socket.error) as err:
+                raise PyitectError(
+                    "Could not fetch plugin '%s@%s' from '%s'"
+                    % (name, version, self.url), cause=err)
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise PyitectError(
+                    "Plugin bundle '%s@%s' does not match it's sha256"
+                    % (name, version))
+            _write_atomic(obj_path, data)
+        # unpack beside the target and rename it into place
+        target = self.bundle_path(digest)
+        _makedirs(os.path.dirname(target))
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(target))
+        try:
+            with zipfile.ZipFile(obj_path) as bundle:
+                for member in bundle.namelist():
+                    path = os.path.normpath(member)
+                    if path.startswith(os.pardir) or os.path.isabs(path):
+                        raise PyitectError(
+                            "Plugin bundle '%s@%s' has an unsafe path '%s'"
+                            % (name, version, member))
+                bundle.extractall(tmp)
+            try:
+                _replace(tmp, target)
+            except OSError:
+                # another process unpacked it first
+                if not os.path.isdir(target):
+                    raise
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp)
+        if not os.path.isdir(folder):
+            raise PyitectError(
+                "Plugin bundle '%s@%s' has no '%s' folder"
+                % (name, version, name))
+        return folder
+
+    def fetch(self, config, system=None):
+        """Fetch the plugins a system config needs into the cache
+
+        the bundles are downloaded `workers` at a time, cached bundles
+        aren't downloaded again
+
+        Args:
+            config (dict): A mapping of component names to version
+                requirements
+            system (System, None): a system whose plugins are used first,
+                see :meth:`select`
+
+        Returns:
+            list: paths to the plugin folders, ready for
+            :meth:`System.add_plugin <pyitect.System.add_plugin>`
+
+        Raises:
+            PyitectError: if any bundle could not be fetched
+        """
+        self.fetch_index()
+        selected = self.select(config, system)
+        folders = {}
+
+        def fetch(key):
+            folders[key] = self.fetch_bundle(key[0], key[1], selected[key])
+
+        keys = sorted(selected)
+        results = _run_ordered(keys, {}, fetch, self.workers)
+        for key, (duration, error) in results:
+            if error is not None:
+                raise error
+        return [folders[key] for key in keys]
+
+    def sync(self, system):
+        """Fetch the plugins a system's config needs and add them to it
+
+        Args:
+            system (System): the system to add the plugins to, the
+                requirements it's plugins already meet are skipped
+
+        Returns:
+            list: the :class:`Plugin <pyitect.Plugin>` objects added
+        """
+        added = []
+        for folder in self.fetch(system.config, system):
+            try:
+                added.append(system.add_plugin(folder))
+            except PyitectDupError:
+                pass
+        return added
+
+
+def _provides_locally(system, component, plugin_req, spec):
+    """Does a plugin the system has provide a component matching a
+    requirement?"""
+    for name, versions in system.plugins.items():
+        if plugin_req and name != plugin_req:
+            continue
+        for version, plugin in versions.items():
+            if component in plugin.provides and spec.match(version):
+                return True
+    return False
+
+
+# renaming over an existing file only works everywhere with os.replace
+_replace = getattr(os, "replace", os.rename)
+
+
+def _read_url(url, timeout):
+    response = urlopen(url, timeout=timeout)
+    try:
+        return response.read()
+    finally:
+        response.close()
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as err:
+        if err.errno != errno.EEXIST:
+            raise
+
+
+def _write_atomic(path, data):
+    """Write a file through a temporary file renamed into place"""
+    _makedirs(os.path.dirname(path))
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        _replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
@@ -0,0 +1,155 @@
+"""
+Tracing hooks for the phases of a plugin system
+
+A :class:`System <pyitect.System>` opens a span around each phase of it's
+work, searching, adding plugins, resolving providers, loading plugins,
+importing plugin modules and running `on_enable` hooks. The spans go to the
+system's tracer, by default a :class:`NullTracer` that does nothing.
+
+To see the spans pass a :class:`ChromeTracer` as the system's `tracer`, it
+records them as Chrome trace events that can be opened in a trace viewer
+(`chrome://tracing`, Perfetto). Applications can open their own spans on the
+same tracer so pyitect's phases line up with them on the timeline.
+
+Other tracing backends can subclass :class:`Tracer` and implement
+:meth:`Tracer.begin` and :meth:`Tracer.end`.
+"""
+from __future__ import (print_function)
+
+import os
+import json
+import time
+import threading
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+class Span(object):
+    """A span opened on a tracer, use it as a context manager
+
+    Attributes:
+        name (str): the name of the span
+        attrs (dict): the span's attributes
+    """
+
+    __slots__ = ("tracer", "name", "attrs")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Add attributes to the span, they are reported when it ends"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.tracer.begin(self.name, self.attrs)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        if exc_type is not None:
+            self.attrs["error"] = repr(exc_value)
+        self.tracer.end(self.name, self.attrs)
+
+
+class _NullSpan(object):
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Tracer(object):
+    """Base class of tracers
+
+    spans on a thread are always nested, :meth:`end` is called for the
+    innermost open span first
+    """
+
+    def span(self, name, **attrs):
+        """Open a span
+
+        Args:
+            name (str): the name of the span
+            **attrs: attributes of the span
+
+        Returns:
+            Span: the span, the tracer's :meth:`begin` is called when it is
+            entered and :meth:`end` when it is exited
+        """
+        return Span(self, name, attrs)
+
+    def begin(self, name, attrs):
+        """Called when a span begins"""
+
+    def end(self, name, attrs):
+        """Called when a span ends"""
+
+
+class NullTracer(Tracer):
+    """A tracer that ignores all spans, all of them share one no-op span"""
+
+    def span(self, name, **attrs):
+        return _null_span
+
+
+class ChromeTracer(Tracer):
+    """Records spans as Chrome trace events
+
+    Attributes:
+        events (list): the recorded trace events
+    """
+
+    def __init__(self):
+        self.events = []
+        self._pid = os.getpid()
+        self._start = _clock()
+        self._lock = threading.Lock()
+
+    def _event(self, name, phase, attrs):
+        event = {
+            "name": name,
+            "cat": "pyitect",
+            "ph": phase,
+            "ts": (_clock() - self._start) * 1000000.0,
+            "pid": self._pid,
+            "tid": threading.current_thread().ident,
+            "args": dict((key, str(value)) for key, value in attrs.items()),
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def begin(self, name, attrs):
+        self._event(name, "B", attrs)
+
+    def end(self, name, attrs):
+        self._event(name, "E", attrs)
+
+    def to_json(self):
+        """returns the recorded events as a Chrome trace JSON string"""
+        with self._lock:
+            events = list(self.events)
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
+
+    def write(self, path):
+        """Write the recorded events to a Chrome trace JSON file
+
+        Args:
+            path (str): the file to write
+        """
+        with open(path, "w") as f:
+            f.write(self.to_json())
@@ -0,0 +1,230 @@
+"""
+Hosts plugins in a pool of worker processes
+
+Plugins selected with :meth:`System.host_plugins <pyitect.System.host_plugins>`
+are never imported in the process that owns the :class:`System
+<pyitect.System>`. Their components are loaded as :class:`RemoteComponent`
+stubs, calling a stub runs the component inside a worker process.
+
+The owning system still does all of the discovery and resolution. A hosted
+plugin is sent to the workers as a load plan, the list of :class:`Plugin
+<pyitect.Plugin>` objects it depends on in the order they need to be imported
+along with the components to inject into :mod:`pyitect.imports` for each one.
+"""
+from __future__ import (print_function)
+
+import hashlib
+import multiprocessing
+import pickle
+import threading
+import time
+
+from . import imports
+from .pyitect import (
+    have_module_getattr, _pushed_import_scope, _SCOPE_ATTR)
+
+# plan keys mapped to `dicts` of plugin keys to loaded modules,
+# only ever filled inside the worker processes
+_plans = {}
+
+
+def _get_path(obj, path):
+    for part in path.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+class _PlanScope(object):
+    """The components injected into a hosted plugin, looked up by
+    :mod:`pyitect.imports` like a system's import scope"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def provides(self, name):
+        return name in self.values
+
+    def get(self, name):
+        return self.values[name]
+
+
+def _load_plan(plan_key, blob):
+    modules = _plans.get(plan_key)
+    if modules is not None:
+        return modules
+    modules = {}
+    for plugin, injections in pickle.loads(blob):
+        values = dict(
+            (req_name, _get_path(modules[dep_key], path))
+            for req_name, (dep_key, path) in injections.items())
+        # the injections stay installed for the life of the worker so the
+        # plugin's functions can import them when they are called
+        if have_module_getattr:
+            scope = _PlanScope(values)
+            with _pushed_import_scope(scope):
+                module = plugin.load()
+            setattr(module, _SCOPE_ATTR, scope)
+            modules[(plugin.name, plugin.version)] = module
+        else:
+            for req_name, obj in values.items():
+                setattr(imports, req_name, obj)
+            modules[(plugin.name, plugin.version)] = plugin.load()
+    _plans[plan_key] = modules
+    return modules
+
+
+class _PlanMissing(Exception):
+    """Raised in a worker called without the plan it hasn't loaded yet"""
+
+
+def _call(plan_key, blob, plugin_key, path, args, kwargs):
+    if blob is None and plan_key not in _plans:
+        raise _PlanMissing(plan_key)
+    modules = _load_plan(plan_key, blob)
+    obj = _get_path(modules[plugin_key], path)
+    return obj(*args, **kwargs)
+
+
+class ProcessHost(object):
+    """A pool of worker processes that host plugins
+
+    Attributes:
+        plugins (set): names of the plugins loaded in the workers
+        processes (int, None): number of worker processes,
+            `None` uses the cpu count
+    """
+
+    def __init__(self, plugins, processes=None):
+        """Init the host, the worker processes start on first use
+
+        Args:
+            plugins (iterable): names of the plugins to host
+            processes (int, None): number of worker processes
+        """
+        self.plugins = set(plugins)
+        self.processes = processes
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def make_plan(self, plan):
+        """Serialise a load plan once, calls send the bytes only to the
+        workers that haven't loaded it yet
+
+        Args:
+            plan (list): `(plugin, injections)` tuples in load order,
+                `injections` maps component names to
+                `(plugin_key, path)` tuples of already planned plugins
+
+        Returns:
+            tuple: `(plan_key, blob)`
+        """
+        blob = pickle.dumps(plan, pickle.HIGHEST_PROTOCOL)
+        return hashlib.sha1(blob).hexdigest(), blob
+
+    def call_async(self, plan_key, blob, plugin_key, path, args, kwargs):
+        """Call a hosted component in a worker without waiting
+
+        the call is sent with just the plan's key, a worker that hasn't
+        loaded the plan yet refuses it and it's sent again with the plan
+
+        Returns:
+            an `AsyncResult` like object, its `get` returns the call's result
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            pool = self._pool
+        return _RemoteResult(
+            pool, (plan_key, blob, plugin_key, path, args, kwargs))
+
+    def close(self):
+        """Stop the worker processes"""
+        with self._pool_lock:
+            pool = self._pool
+            self._pool = None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+class _RemoteResult(object):
+
+    def __init__(self, pool, call):
+        self._pool = pool
+        self._call = call
+        plan_key, blob, plugin_key, path, args, kwargs = call
+        self._result = pool.apply_async(
+            _call, (plan_key, None, plugin_key, path, args, kwargs))
+        self._resent = False
+
+    def _resend_on_miss(self):
+        """Send the call again with the plan if the worker didn't have it
+
+        Returns:
+            bool: was the call sent again
+        """
+        if (self._resent or not self._result.ready()
+                or self._result.successful()):
+            return False
+        try:
+            self._result.get(0)
+        except _PlanMissing:
+            self._resent = True
+            self._result = self._pool.apply_async(_call, self._call)
+            return True
+        except Exception:
+            pass
+        return False
+
+    def ready(self):
+        self._resend_on_miss()
+        return self._result.ready()
+
+    def wait(self, timeout=None):
+        start = time.time()
+        self._result.wait(timeout)
+        if self._resend_on_miss():
+            if timeout is not None:
+                timeout = max(0, timeout - (time.time() - start))
+            self._result.wait(timeout)
+
+    def get(self, timeout=None):
+        self.wait(timeout)
+        return self._result.get(0)
+
+
+class RemoteComponent(object):
+    """A stub for a component loaded in a :class:`ProcessHost`
+
+    calling the stub calls the component in a worker process, arguments and
+    results are pickled so both must be picklable
+
+    Attributes:
+        component (Component): the component the stub stands in for
+    """
+
+    def __init__(self, host, component, plan_key, blob, plugin_key):
+        self.component = component
+        self._host = host
+        self._plan_key = plan_key
+        self._blob = blob
+        self._plugin_key = plugin_key
+
+    def call_async(self, *args, **kwargs):
+        """Call the component without waiting for the result
+
+        Returns:
+            an object with `ready`, `wait` and `get` methods like
+            :class:`multiprocessing.pool.AsyncResult`
+        """
+        return self._host.call_async(
+            self._plan_key, self._blob, self._plugin_key,
+            self.component.path, args, kwargs)
+
+    def __call__(self, *args, **kwargs):
+        return self.call_async(*args, **kwargs).get()
+
+    def __repr__(self):
+        return "RemoteComponent(%s@%s:%s)" % (
+            self.component.name, self.component.plugin,
+            self.component.version)
@@ -0,0 +1,5 @@
+from __future__ import (print_function)
+
+eager = "eager"
+idle = "idle"
+lazy = "lazy"
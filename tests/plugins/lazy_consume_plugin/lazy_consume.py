@@ -0,0 +1,6 @@
+from __future__ import (print_function)
+
+
+def lazy_foobar():
+    from pyitect.imports import foo
+    return foo() + "bar"
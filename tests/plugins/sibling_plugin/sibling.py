@@ -0,0 +1,5 @@
+from __future__ import (print_function)
+
+import sibling_plugin_helper
+
+greeting = sibling_plugin_helper.GREETING
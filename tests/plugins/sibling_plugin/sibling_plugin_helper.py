@@ -0,0 +1 @@
+GREETING = "hello from a sibling"
@@ -0,0 +1,9 @@
+from __future__ import (print_function)
+
+import time
+
+time.sleep(0.3)
+
+
+def slow():
+    return "slow"
@@ -3,7 +3,12 @@ from __future__ import (print_function)
 import os
 import sys
 import json
+import types
+import weakref
 import inspect
+import shutil
+import tempfile
+import time
 from pprint import pprint
 from nose import tools
 
@@ -268,6 +273,1224 @@ def test_17_subtype_ordering():
     a = system.load("a", key=key2)
     tools.eq_(a(), "AB")
 
+
+def test_18_memory_report():
+    global folder_path
+
+    cfgfile = open(os.path.join(folder_path, "config.json"))
+    cfg = json.load(cfgfile)
+    cfgfile.close()
+    system = pyitect.System(cfg, track_memory=True)
+    system.search(os.path.join(folder_path, "plugins"))
+    system.enable_plugins(
+        system.plugins[n][v]
+        for n in system.plugins
+        for v in system.plugins[n]
+        if n != "bad_plugin")
+    system.load("foobar")
+
+    report = system.memory_report()
+    names = [entry[0] for entry in report]
+    sizes = [entry[2] for entry in report]
+    tools.eq_(sizes, sorted(sizes, reverse=True))
+    for registry in ("plugins", "component_map", "components"):
+        tools.ok_(registry in names)
+    if pyitect.pyitect._have_tracemalloc:
+        tools.ok_("consume_plugin:0.0.1" in names)
+        tools.ok_("provide_plugin:1.0.0" in names)
+
+    # closing one system doesn't stop the accounting of another
+    other = pyitect.System({}, track_memory=True)
+    system.close()
+    other.search(os.path.join(folder_path, "plugins"))
+    other.enable_plugins(other.plugins["provide_plugin"])
+    other.load("foo")
+    if pyitect.pyitect._have_tracemalloc:
+        import tracemalloc
+        tools.ok_(tracemalloc.is_tracing())
+        key = ("provide_plugin", pyitect.Version("2.0.0"))
+        tools.ok_(other.plugin_memory[key]["load"] > 0)
+    other.close()
+    if pyitect.pyitect._have_tracemalloc:
+        tools.ok_(not tracemalloc.is_tracing())
+
+
+def test_19_process_host():
+    global folder_path
+
+    system = pyitect.System({})
+    system.search(os.path.join(folder_path, "plugins"))
+    system.enable_plugins(
+        list(system.plugins["provide_plugin"].values()) +
+        list(system.plugins["consume_plugin"].values()))
+    system.host_plugins(["consume_plugin"], processes=2)
+    try:
+        foobar = system.load("foobar")
+        tools.ok_(isinstance(foobar, pyitect.RemoteComponent))
+        tools.eq_(foobar(), "foobar")
+        results = [foobar.call_async() for i in range(4)]
+        tools.eq_([r.get() for r in results], ["foobar"] * 4)
+        tools.ok_(("consume_plugin", pyitect.Version("0.0.1"))
+                  not in system.loaded_plugins)
+    finally:
+        system.close()
+
+    # hosted functions can import their components when they are called
+    system = pyitect.System({})
+    system.search(os.path.join(folder_path, "plugins"))
+    system.register_plugin({
+        "name": "hosted_late_import", "author": "Ryex", "version": "1.0.0",
+        "consumes": {"foo": ""}, "provides": {"late_foo": ""}
+    }, source=(
+        "def late_foo():\n"
+        "    from pyitect.imports import foo\n"
+        "    return foo() + '!'\n"))
+    system.enable_plugins(
+        system.plugins["provide_plugin"], system.plugins["hosted_late_import"])
+    system.host_plugins(["hosted_late_import"], processes=1)
+    try:
+        late_foo = system.load("late_foo")
+        results = []
+        for i in range(3):
+            results.append(late_foo.call_async())
+            tools.eq_(results[-1].get(), system.load("foo")() + "!")
+        # the plan is only sent to the worker while it hasn't loaded it
+        tools.eq_([r._resent for r in results], [True, False, False])
+    finally:
+        system.close()
+
+
+def test_20_call_stats():
+    global folder_path
+
+    system = pyitect.System({}, instrument=True)
+    system.search(os.path.join(folder_path, "plugins"))
+    system.enable_plugins(list(system.plugins["subtype_plugin"].values()))
+    a = system.load("a", subs=False)
+    xy = system.load("x.y")
+    for i in range(5):
+        tools.eq_(a(), "A")
+    xy()
+
+    tools.ok_(isinstance(a, pyitect.InstrumentedComponent))
+    tools.eq_(a.__name__, "a")
+    report = system.call_report()
+    tools.eq_(len(report), 2)
+    stats = a.stats
+    tools.eq_(stats.calls, 5)
+    tools.eq_(stats.errors, 0)
+    tools.eq_(sum(stats.buckets), 5)
+    tools.ok_(stats.percentile(99) >= stats.percentile(50))
+    tools.ok_(system.call_stats[stats.key] is stats)
+
+    # calls from several threads are all counted
+    import threading
+
+    def call_a():
+        for i in range(1000):
+            a()
+    threads = [threading.Thread(target=call_a) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    tools.eq_(stats.calls, 4005)
+    tools.eq_(sum(stats.buckets), 4005)
+    system.close()
+
+
+def test_21_close_system():
+    import gc
+    global folder_path
+
+    system = pyitect.System({})
+    tools.ok_(system in pyitect.System.systems)
+    system.search(os.path.join(folder_path, "plugins"))
+    system.enable_plugins(list(system.plugins["relative_plugin"].values()))
+    TestClass = system.load("TestClass")
+    module_name = TestClass.__module__
+    tools.ok_(module_name in sys.modules)
+
+    system.close()
+    tools.ok_(module_name not in sys.modules)
+    tools.ok_(module_name.split(".")[0] not in sys.modules)
+    tools.ok_(not system.components)
+    tools.ok_(not system.loaded_plugins)
+    tools.ok_(system not in pyitect.System.systems)
+
+    system = pyitect.System({})
+    ref = weakref.ref(system)
+    del system
+    gc.collect()
+    # only weakly held
+    tools.ok_(ref() is None)
+    tools.ok_(all(
+        isinstance(system, pyitect.System)
+        for system in pyitect.System.systems))
+
+
+def test_22_catalogue_overlays():
+    global folder_path
+
+    catalogue = pyitect.Catalogue.discover(
+        os.path.join(folder_path, "plugins"), enable_yaml=True)
+    plugins = [
+        catalogue.plugins[n][v]
+        for n in catalogue.plugins
+        for v in catalogue.plugins[n]
+        if n != "bad_plugin"
+        ]
+    tenants = [
+        catalogue.system({"foo": "provide_plugin:<=1.0.0"}),
+        catalogue.system({"foo": "provide_plugin:<=1.0.0"}),
+        catalogue.system({"foo": "provide_plugin:==2.0.0"}),
+        ]
+    for tenant in tenants:
+        tools.ok_(tenant.plugins is catalogue.plugins)
+        tenant.enable_plugins(plugins)
+
+    foobars = [tenant.load("foobar") for tenant in tenants]
+    tools.eq_([foobar() for foobar in foobars],
+              ["foobar", "foobar", "foo2bar"])
+    # same resolved dependencies share the module
+    tools.ok_(foobars[0] is foobars[1])
+    tools.ok_(foobars[0] is not foobars[2])
+    tools.ok_(tenants[0].load("foo") is tenants[1].load("foo"))
+
+    for tenant in tenants:
+        tenant.close()
+    tools.ok_(catalogue.plugins)
+    catalogue.close()
+
+
+def test_23_deferred_on_enable():
+    global folder_path
+
+    for flush in (False, True):
+        system = pyitect.System({}, defer_on_enable=True)
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins(
+            list(system.plugins["on_enable_plugin"].values()))
+        plugin_key = ("on_enable_plugin", pyitect.Version("0.0.1"))
+        tools.ok_(plugin_key in system.pending_on_enables)
+        tools.ok_(plugin_key not in system.loaded_plugins)
+
+        if flush:
+            system.flush_on_enables()
+        else:
+            system.load_plugin("on_enable_plugin", "0.0.1")
+        tools.ok_(not system.pending_on_enables)
+        tools.ok_(plugin_key in system.loaded_plugins)
+        system.close()
+
+    # pending hooks are flushed in dependency order, even when a plugin's
+    # consumed components only load once it imports them
+    if sys.version_info[:2] < (3, 7):
+        return
+    ran = []
+    pyitect.flush_hook_calls = ran
+    for workers in (None, 2):
+        del ran[:]
+        system = pyitect.System(
+            {}, defer_on_enable=True, on_enable_workers=workers,
+            lazy_imports=True)
+        for name, consumes in (("flush_a", {}),
+                               ("flush_b", {"a": "flush_a"}),
+                               ("flush_c", {"b": "flush_b"})):
+            source = (
+                "import pyitect\n"
+                "provided = %r\n"
+                "def on_enable(plugin):\n"
+                "    pyitect.flush_hook_calls.append(plugin.name)\n"
+                % (name,))
+            system.register_plugin({
+                "name": name, "author": "Ryex", "version": "1.0.0",
+                "on_enable": "on_enable", "consumes": consumes,
+                "provides": {name[-1]: "provided"}
+            }, source=source)
+        system.enable_plugins(
+            *[system.plugins[name] for name in
+              ("flush_a", "flush_b", "flush_c")])
+        system.flush_on_enables()
+        tools.eq_(ran, ["flush_a", "flush_b", "flush_c"])
+        system.close()
+    del pyitect.flush_hook_calls
+
+
+def test_24_ordered_on_enables():
+    global folder_path
+
+    system = pyitect.System({}, on_enable_workers=4)
+    system.search(os.path.join(folder_path, "plugins"))
+    good = system.plugins["on_enable_plugin"][pyitect.Version("0.0.1")]
+    bad = pyitect.Plugin({
+        "name": "bad_on_enable_plugin",
+        "author": "Ryex",
+        "version": "0.0.1",
+        "file": "plugin.py",
+        "on_enable": "no_such_function",
+        "consumes": {},
+        "provides": {}
+        }, good.path)
+    system.plugins[bad.name] = {bad.version: bad}
+
+    tools.assert_raises(
+        pyitect.PyitectOnEnableError,
+        system.enable_plugins,
+        [good, bad])
+
+    report = dict((name, error) for name, duration, error
+                  in system.on_enable_report)
+    tools.eq_(len(report), 2)
+    tools.ok_(report["on_enable_plugin:0.0.1"] is None)
+    tools.ok_(isinstance(
+        report["bad_on_enable_plugin:0.0.1"], pyitect.PyitectOnEnableError))
+    system.close()
+
+    # hooks on several threads at once share the memory and budget records
+    import warnings
+    names = ["on_enable_plugin_%d" % i for i in range(8)]
+    system = pyitect.System(
+        {}, on_enable_workers=4, track_memory=True,
+        plugin_budgets=dict((name, {"budget": 0}) for name in names))
+    plugins = []
+    for name in names:
+        plugin = pyitect.Plugin({
+            "name": name,
+            "author": "Ryex",
+            "version": "0.0.1",
+            "file": "plugin.py",
+            "on_enable": "on_enable_foo_func",
+            "consumes": {},
+            "provides": {}
+            }, good.path)
+        system.plugins[name] = {plugin.version: plugin}
+        plugins.append(plugin)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        system.enable_plugins(plugins)
+    tools.eq_(len(system.on_enable_report), 8)
+    for name in names:
+        tools.ok_((name, plugin.version) in system.plugin_memory)
+    tools.eq_(sorted(name for name, phase, duration, budget
+                     in system.budget_violations
+                     if phase == "on_enable"),
+              [name + ":0.0.1" for name in names])
+    tools.eq_(system.stats["budget_violations"],
+              len(system.budget_violations))
+    system.close()
+
+
+def test_25_search_limits():
+    global folder_path
+    plugins_path = os.path.join(folder_path, "plugins")
+
+    def found(**kwargs):
+        system = pyitect.System({}, enable_yaml=True)
+        system.search(plugins_path, **kwargs)
+        return set(system.plugins)
+
+    everything = found()
+    tools.ok_("provide_plugin" in everything)
+    tools.eq_(found(levels=[1]), everything)
+    tools.eq_(found(max_depth=1), everything)
+    tools.eq_(found(max_depth=0), set())
+    tools.eq_(found(levels=[2]), set())
+    tools.eq_(
+        found(ignore=["provide_*", "__pycache__"]),
+        everything - set(["provide_plugin"]))
+
+
+def test_26_lazy_imports():
+    global folder_path
+    if sys.version_info[:2] < (3, 7):
+        return
+    system = pyitect.System({}, lazy_imports=True)
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins([
+            system.plugins[n][v]
+            for n in ("provide_plugin", "lazy_consume_plugin")
+            for v in system.plugins[n]
+            ])
+        lazy_foobar = system.load("lazy_foobar")
+        # foo is only loaded once the plugin imports it
+        provided = [name for name, _ in system.loaded_plugins]
+        tools.ok_("provide_plugin" not in provided)
+        tools.eq_(lazy_foobar(), "foobar")
+        provided = [name for name, _ in system.loaded_plugins]
+        tools.ok_("provide_plugin" in provided)
+        with tools.assert_raises(ImportError):
+            from pyitect.imports import foo
+    finally:
+        system.close()
+
+    # each system's copy of a plugin imports through it's own system
+    systems = []
+    try:
+        for requires in ("provide_plugin:<2.0.0", "provide_plugin:>=2.0.0"):
+            for lazy in (False, True):
+                system = pyitect.System(
+                    {"foo": requires}, lazy_imports=lazy)
+                systems.append(system)
+                system.search(os.path.join(folder_path, "plugins"))
+                system.enable_plugins(
+                    system.plugins["provide_plugin"],
+                    system.plugins["lazy_consume_plugin"])
+        funcs = [system.load("lazy_foobar") for system in systems]
+        expected = ["foobar", "foobar", "foo2bar", "foo2bar"]
+        tools.eq_([func() for func in funcs], expected)
+        for system in systems[2:]:
+            system.close()
+        tools.eq_([func() for func in funcs[:2]], expected[:2])
+    finally:
+        for system in systems:
+            system.close()
+
+
+def test_27_evict_plugins():
+    global folder_path
+    system = pyitect.System({}, max_loaded_plugins=1)
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins([
+            system.plugins[n][v]
+            for n in ("provide_plugin", "consume_plugin", "relative_plugin")
+            for v in system.plugins[n]
+            ])
+        system.load("foobar")
+        # provide_plugin is pinned while consume_plugin uses it
+        tools.eq_(len(system.loaded_plugins), 2)
+        tools.eq_(system.stats["evictions"], 0)
+        system.load("TestClass")
+        tools.eq_(
+            list(system.loaded_plugins),
+            [("relative_plugin", pyitect.Version("0.0.1"))])
+        tools.eq_(system.stats["evictions"], 2)
+        consume = system.plugins["consume_plugin"][pyitect.Version("0.0.1")]
+        tools.ok_(consume.get_module_name() not in sys.modules)
+        tools.eq_(system.load("foobar")(), "foobar")
+        tools.eq_(system.stats["reloads"], 2)
+    finally:
+        system.close()
+
+    # evicting a plugin only invalidates the handles to it's components
+    system = pyitect.System({})
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins(
+            system.plugins["provide_plugin"],
+            system.plugins["relative_plugin"])
+        foo = system.handle("foo")
+        test_class = system.handle("TestClass")
+        foo_obj = foo.get()
+        test_class_obj = test_class.get()
+        system.evict_plugin("relative_plugin", "0.0.1")
+        tools.ok_(foo._obj is foo_obj)
+        tools.ok_(test_class.get() is not test_class_obj)
+    finally:
+        system.close()
+
+
+def test_28_component_handles():
+    global folder_path
+    system = pyitect.System({})
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        versions = system.plugins["provide_plugin"]
+        system.enable_plugins(versions[pyitect.Version("1.0.0")])
+        foo = system.handle("foo")
+        tools.eq_(foo(), "foo")
+        tools.ok_(foo.get() is foo.get())
+        system.enable_plugins(versions[pyitect.Version("2.0.0")])
+        # the new provider is picked up once the handle is invalidated
+        tools.eq_(foo(), "foo2")
+        system.config = {"foo": "provide_plugin:<2.0.0"}
+        tools.eq_(foo(), "foo")
+    finally:
+        system.close()
+
+
+def test_29_load_graph():
+    global folder_path
+    system = pyitect.System({})
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins([
+            system.plugins[n][v]
+            for n in ("provide_plugin", "consume_plugin")
+            for v in system.plugins[n]
+            if str(v) != "2.0.0"
+            ])
+        system.load("foobar")
+        graph = system.load_graph()
+        tools.eq_(
+            graph.edges,
+            {"consume_plugin:0.0.1": set(["provide_plugin:1.0.0"])})
+        path, duration = graph.critical_path()
+        tools.eq_(path, ["provide_plugin:1.0.0", "consume_plugin:0.0.1"])
+        tools.ok_(duration <= graph.times["consume_plugin:0.0.1"][1])
+        tools.ok_('"consume_plugin:0.0.1" -> "provide_plugin:1.0.0"'
+                  in graph.to_dot())
+    finally:
+        system.close()
+
+    graph = pyitect.LoadGraph(
+        {"a:1": (1.0, 4.0), "b:1": (2.0, 2.0), "c:1": (0.5, 0.5)},
+        {"a:1": set(["b:1", "c:1"])})
+    tools.eq_(graph.critical_path(), (["b:1", "a:1"], 3.0))
+    tools.eq_(graph.slack(), {"a:1": 0.0, "b:1": 0.0, "c:1": 1.5})
+    tools.eq_(json.loads(graph.to_json())["critical_path"], ["b:1", "a:1"])
+
+
+def test_30_repository():
+    global folder_path
+    import shutil
+    import hashlib
+    import tempfile
+    import threading
+    import warnings
+    import zipfile
+    from pyitect.repository import Repository
+    try:
+        from http.server import HTTPServer, SimpleHTTPRequestHandler
+    except ImportError:
+        from BaseHTTPServer import HTTPServer
+        from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+    tmp = tempfile.mkdtemp()
+    served = os.path.join(tmp, "served")
+    os.mkdir(served)
+    source = os.path.join(folder_path, "plugins", "provide_plugin")
+    bundle = os.path.join(served, "provide_plugin-1.0.0.zip")
+    with zipfile.ZipFile(bundle, "w") as zf:
+        for name in os.listdir(source):
+            if name.endswith((".json", ".py")):
+                zf.write(
+                    os.path.join(source, name),
+                    os.path.join("provide_plugin", name))
+    with open(bundle, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with open(os.path.join(served, "index.json"), "w") as f:
+        entry = {
+            "url": "provide_plugin-1.0.0.zip",
+            "sha256": digest,
+            "provides": ["foo"]}
+        # loose and broken versions in the index
+        json.dump({"plugins": {"provide_plugin": {
+            "1.0.0": entry, "1.1": entry, "latest": entry}}}, f)
+
+    class Handler(SimpleHTTPRequestHandler):
+        def translate_path(self, path):
+            return os.path.join(served, path.lstrip("/"))
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = "http://127.0.0.1:%d/index.json" % (server.server_address[1],)
+    cache = os.path.join(tmp, "cache")
+    system = pyitect.System({"foo": "provide_plugin:<2.0.0"})
+    try:
+        repo = Repository(url, cache)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            tools.eq_(list(repo.select(system.config)),
+                      [("provide_plugin", "1.1")])
+            added = repo.sync(system)
+        tools.ok_(any("'latest'" in str(w.message) for w in caught))
+        tools.eq_([plugin.name for plugin in added], ["provide_plugin"])
+        tools.ok_(not repo.offline)
+        tools.ok_(added[0].path.startswith(repo.bundle_path(digest)))
+        system.enable_plugins(added)
+        tools.eq_(system.load("foo")(), "foo")
+
+        # requirements the system's own plugins meet aren't fetched,
+        # even if the repository has nothing for them
+        local = pyitect.System({"foo": "provide_plugin:<2.0.0", "foobar": ""})
+        local.search(os.path.join(folder_path, "plugins"))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tools.eq_(repo.select(local.config, system=local), {})
+            tools.assert_raises(
+                pyitect.PyitectNotProvidedError, repo.select, local.config)
+        local.close()
+
+        server.shutdown()
+        server.server_close()
+        # the cache serves the plugins while the repository is down
+        repo = Repository(url, cache, timeout=1)
+        tools.eq_(repo.fetch({"foo": ""}), [added[0].path])
+        tools.ok_(repo.offline)
+    finally:
+        system.close()
+        shutil.rmtree(tmp)
+
+
+def test_31_chrome_tracer():
+    global folder_path
+    tracer = pyitect.ChromeTracer()
+    system = pyitect.System({}, tracer=tracer)
+    try:
+        with tracer.span("startup"):
+            system.search(os.path.join(folder_path, "plugins"))
+            system.enable_plugins([
+                system.plugins[n][v]
+                for n in ("provide_plugin", "consume_plugin")
+                for v in system.plugins[n]
+                ])
+            system.load("foobar")
+    finally:
+        system.close()
+    trace = json.loads(tracer.to_json())["traceEvents"]
+    names = set(event["name"] for event in trace)
+    for name in ("startup", "search", "add_plugin", "resolve_providers",
+                 "load_plugin", "Plugin._load"):
+        tools.ok_(name in names)
+    tools.eq_(
+        len([e for e in trace if e["ph"] == "B"]),
+        len([e for e in trace if e["ph"] == "E"]))
+    loads = [
+        event["args"] for event in trace
+        if event["name"] == "load_plugin" and event["ph"] == "B"]
+    tools.ok_({"plugin": "provide_plugin", "version": "1.0.0",
+               "request": "consume_plugin:0.0.1", "component": "foo"}
+              in loads)
+
+
+def test_32_sibling_imports():
+    global folder_path
+    system = pyitect.System({})
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins(system.plugins["sibling_plugin"])
+        path = list(sys.path)
+        tools.eq_(system.load("sibling_greeting"), "hello from a sibling")
+        # the plugin folder was never put on sys.path
+        tools.eq_(sys.path, path)
+        tools.ok_("sibling_plugin_helper" in sys.modules)
+        if pyitect.pyitect.have_importlib:
+            # builtin modules can't be shadowed by plugin files
+            meta_path = sys.meta_path
+            finder = meta_path.index(pyitect.pyitect._PluginFinder)
+            tools.ok_(finder > meta_path.index(
+                pyitect.pyitect.importlib.machinery.BuiltinImporter))
+            tools.eq_(meta_path[finder + 1],
+                      pyitect.pyitect.importlib.machinery.PathFinder)
+    finally:
+        system.close()
+    # the sibling goes with the plugin
+    tools.ok_("sibling_plugin_helper" not in sys.modules)
+
+
+def test_33_prefetch():
+    global folder_path
+    system = pyitect.System({}, prefetch_workers=2)
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins([
+            system.plugins[n][v]
+            for n in ("provide_plugin", "consume_plugin")
+            for v in system.plugins[n]
+            ])
+        tools.eq_(system.load("foobar")(), "foobar")
+        # provide_plugin was queued as soon as consume_plugin was picked
+        tools.eq_(system.stats["prefetches"], 1)
+        tools.eq_(
+            system.stats["prefetch_hits"] + system.stats["prefetch_cancelled"],
+            1)
+    finally:
+        system.close()
+    tools.eq_(system.stats["prefetch_wasted"], 0)
+
+    # budgets, deadlines and memory accounting need the loading thread,
+    # those plugins are imported by the load itself
+    for kwargs in ({"track_memory": True},
+                   {"plugin_budgets": {"provide_plugin": {"budget": 10}}},
+                   {"import_deadline": 10}):
+        system = pyitect.System({}, prefetch_workers=2, **kwargs)
+        try:
+            system.search(os.path.join(folder_path, "plugins"))
+            system.enable_plugins(
+                system.plugins["provide_plugin"],
+                system.plugins["consume_plugin"])
+            tools.eq_(system.load("foobar")(), "foobar")
+            tools.eq_(system.stats["prefetches"], 0)
+            if "track_memory" in kwargs:
+                tools.ok_(any(
+                    name == "provide_plugin"
+                    for name, version in system.plugin_memory))
+        finally:
+            system.close()
+
+
+def test_34_load_hints():
+    global folder_path
+    system = pyitect.System({})
+    try:
+        system.search(os.path.join(folder_path, "plugins"))
+        plugin = system.plugins["hint_plugin"][pyitect.Version("0.0.1")]
+        tools.eq_(plugin.get_load_hint("hint_idle"), "idle")
+        tools.eq_(plugin.get_load_hint("hint_lazy"), "lazy")
+        tools.eq_(plugin.provides["hint_eager"], "eager")
+        system.enable_plugins(plugin)
+        loaded = set(key[0] for key in system.components)
+        tools.eq_(loaded, set(["hint_eager"]))
+        tools.eq_(system.warmup(), 0)
+        loaded = set(key[0] for key in system.components)
+        tools.eq_(loaded, set(["hint_eager", "hint_idle"]))
+        tools.eq_(system.load("hint_lazy"), "lazy")
+    finally:
+        system.close()
+
+    with tools.assert_raises(ValueError):
+        pyitect.Plugin({
+            "name": "bad_hint", "author": "Ryex", "version": "0.0.1",
+            "file": "bad.py", "consumes": {}, "provides": {},
+            "load": "soon"}, folder_path)
+
+
+def test_35_compact_component_map():
+    global folder_path
+    plugins_path = os.path.join(folder_path, "plugins")
+    names = ("provide_plugin", "consume_plugin", "subtype_plugin")
+
+    def build(component_map=None):
+        system = pyitect.System({}, component_map=component_map)
+        system.search(plugins_path)
+        system.enable_plugins([
+            system.plugins[n][v] for n in names for v in system.plugins[n]])
+        return system
+
+    default = build()
+    compact = build(pyitect.CompactComponentMap())
+    try:
+        tools.eq_(
+            sorted(compact.component_map), sorted(default.component_map))
+
+        def providers(system):
+            return sorted(system.iter_component_providers(
+                "a", subs=True, vers=True))
+
+        tools.eq_(providers(compact), providers(default))
+        tools.eq_(
+            compact.component_map["foo"], default.component_map["foo"])
+        tools.eq_(compact.load("foobar")(), "foobar")
+        tools.eq_(
+            compact.load("a.b").__name__, default.load("a.b").__name__)
+        with tools.assert_raises(pyitect.PyitectDupError):
+            compact.enable_plugins(
+                compact.plugins["subtype_plugin"][pyitect.Version("1.0.0")])
+    finally:
+        default.close()
+        compact.close()
+
+    # rows stay sorted for lookups as providers come and go
+    component_map = pyitect.CompactComponentMap()
+    components = [
+        pyitect.Component("c", plugin, "Ryex", pyitect.Version(version), "c")
+        for plugin in ("p2", "p1", "p3")
+        for version in ("2.0.0", "1.0.0", "1.5.0")]
+    for component in components:
+        component_map.add(component)
+    tools.eq_(component_map.plugin_names("c"), ["p2", "p1", "p3"])
+    tools.eq_(sorted(component_map.versions("c", "p1")), [
+        pyitect.Version(v) for v in ("1.0.0", "1.5.0", "2.0.0")])
+    for component in components:
+        tools.eq_(component_map.get_component(
+            "c", component.plugin, component.version), component)
+    for component in components[:3]:
+        component_map.remove(component)
+    tools.eq_(component_map.plugin_names("c"), ["p1", "p3"])
+    tools.eq_(component_map.versions("c", "p2"), [])
+    tools.ok_(component_map.get_component(
+        "c", "p2", pyitect.Version("1.0.0")) is None)
+    for component in components[3:]:
+        component_map.remove(component)
+    tools.ok_("c" not in component_map)
+
+
+def test_36_import_budgets():
+    global folder_path
+    import warnings
+
+    def build(**kwargs):
+        system = pyitect.System({}, **kwargs)
+        system.search(os.path.join(folder_path, "plugins"))
+        system.enable_plugins(system.plugins["slow_plugin"])
+        return system
+
+    system = build(plugin_budgets={"slow_plugin": {"budget": 0.05}})
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            tools.eq_(system.load("slow")(), "slow")
+        tools.ok_(any(
+            issubclass(w.category, pyitect.PyitectBudgetWarning)
+            for w in caught))
+        tools.eq_(system.stats["budget_violations"], 1)
+        tools.eq_(
+            system.budget_violations[0][:2], ("slow_plugin:0.0.1", "load"))
+    finally:
+        system.close()
+
+    system = build(import_deadline=0.05)
+    try:
+        with tools.assert_raises(pyitect.PyitectLoadError):
+            system.load("slow")
+        tools.eq_(system.stats["deadline_aborts"], 1)
+        tools.ok_(not system.loaded_plugins)
+        # the abandoned import is still running, it isn't started again
+        with tools.assert_raises(pyitect.PyitectLoadError):
+            system.load("slow")
+        tools.eq_(system.stats["deadline_aborts"], 1)
+        for thread in list(system._deadline_threads.values()):
+            thread.join()
+        system.import_deadline = None
+        tools.eq_(system.load("slow")(), "slow")
+    finally:
+        system.close()
+
+    def build_consumer(**kwargs):
+        system = build(**kwargs)
+        system.register_plugin({
+            "name": "slow_consumer",
+            "author": "Ryex",
+            "version": "1.0.0",
+            "consumes": {"slow": ""},
+            "provides": {"uses_slow": ""}
+        }, source=(
+            "from pyitect.imports import slow\n"
+            "def uses_slow():\n"
+            "    return slow()\n"))
+        system.enable_plugins(system.plugins["slow_consumer"])
+        return system
+
+    # deadlined plugins aren't prefetched, the load imports them
+    system = build_consumer(import_deadline=0.05, prefetch_workers=2)
+    try:
+        start = time.time()
+        with tools.assert_raises(pyitect.PyitectLoadError):
+            system.load("uses_slow")
+        tools.ok_(time.time() - start < 0.25)
+        tools.eq_(system.stats["prefetches"], 0)
+        tools.eq_(system.stats["deadline_aborts"], 1)
+    finally:
+        system.close()
+
+    # a deadline set while the plugin is being prefetched still applies
+    system = build_consumer(prefetch_workers=2)
+    try:
+        consumer = system.plugins["slow_consumer"][pyitect.Version("1.0.0")]
+        system._start_prefetches(consumer, system.config)
+        tools.eq_(system.stats["prefetches"], 1)
+        prefetch = system._prefetches[
+            ("slow_plugin", pyitect.Version("0.0.1"))]
+        while prefetch.state == "queued":
+            time.sleep(0.01)
+        system.import_deadline = 0.05
+        start = time.time()
+        with tools.assert_raises(pyitect.PyitectLoadError):
+            system.load("uses_slow")
+        tools.ok_(time.time() - start < 0.25)
+        tools.eq_(system.stats["deadline_aborts"], 1)
+        tools.ok_(not system.loaded_plugins)
+        with tools.assert_raises(pyitect.PyitectLoadError):
+            system.load("uses_slow")
+        prefetch.done.wait()
+        system.import_deadline = None
+        tools.eq_(system.load("uses_slow")(), "slow")
+    finally:
+        system.close()
+
+
+def test_37_bulk_enable_is_atomic():
+    global folder_path
+    plugins_path = os.path.join(folder_path, "plugins")
+    for component_map in (None, pyitect.CompactComponentMap()):
+        system = pyitect.System({}, component_map=component_map)
+        try:
+            system.search(plugins_path)
+            v1 = pyitect.Version("1.0.0")
+            system.enable_plugins(system.plugins["subtype_plugin"][v1])
+            before = sorted(system.component_map)
+            # the second plugin is fine, the duplicate must undo it
+            with tools.assert_raises(pyitect.PyitectDupError):
+                system.enable_plugins(
+                    system.plugins["consume_plugin"],
+                    [system.plugins["subtype_plugin"][v1]])
+            tools.eq_(sorted(system.component_map), before)
+            tools.eq_(system.enabled_plugins, [("subtype_plugin", v1)])
+            # nested lists and maps are flattened
+            system.enable_plugins(
+                list(system.plugins["consume_plugin"].values()),
+                system.plugins["provide_plugin"])
+            tools.eq_(len(system.enabled_plugins), 4)
+            tools.eq_(system.load("foo")(), "foo2")
+        finally:
+            system.close()
+
+
+def test_38_update_config():
+    global folder_path
+    plugins_path = os.path.join(folder_path, "plugins")
+    system = pyitect.System({"foo": "provide_plugin:<=1.0.0"})
+    try:
+        system.search(plugins_path)
+        system.enable_plugins(
+            system.plugins["provide_plugin"],
+            system.plugins["consume_plugin"],
+            system.plugins["sibling_plugin"])
+        tools.eq_(system.load("foobar")(), "foobar")
+        greeting = system.load("sibling_greeting")
+        handle = system.handle("foo")
+        tools.eq_(handle(), "foo")
+
+        delta = system.update_config({"foo": "provide_plugin:>=2.0.0"})
+        tools.eq_(delta["changed"], ["foo"])
+        tools.eq_(
+            delta["rebound"]["foo"][1],
+            ("foo", "provide_plugin", pyitect.Version("2.0.0")))
+        tools.eq_(delta["reloaded"], ["consume_plugin:0.0.1"])
+        tools.eq_([key[0] for key in delta["components"]], ["foobar"])
+        tools.eq_(system.load("foobar")(), "foo2bar")
+        tools.eq_(handle(), "foo2")
+        # unaffected components keep their objects
+        tools.ok_(system.load("sibling_greeting") is greeting)
+
+        delta = system.update_config({"foo": "provide_plugin:>=2.0.0"})
+        tools.eq_(delta["changed"], [])
+        tools.eq_(delta["reloaded"], [])
+    finally:
+        system.close()
+
+    def build(config):
+        system = pyitect.System(config)
+        for name, version in (("foop", "1.0.0"), ("foop", "2.0.0"),
+                              ("barp", "1.0.0"), ("barp", "2.0.0")):
+            component = name[:-1]
+            system.register_plugin({
+                "name": name,
+                "author": "Ryex",
+                "version": version,
+                "consumes": {},
+                "provides": {component: ""}
+            }, source="def %s():\n    return '%s%s'\n" % (
+                component, component, version[0]))
+        system.register_plugin({
+            "name": "p_plugin",
+            "author": "Ryex",
+            "version": "1.0.0",
+            "consumes": {"foo": "", "bar": ""},
+            "provides": {"p": ""}
+        }, source=(
+            "from pyitect.imports import foo, bar\n"
+            "def p():\n"
+            "    return foo() + '+' + bar()\n"))
+        system.register_plugin({
+            "name": "q_plugin",
+            "author": "Ryex",
+            "version": "1.0.0",
+            "consumes": {"p": "", "foo": "foop:<2.0.0"},
+            "provides": {"q": ""}
+        }, source=(
+            "from pyitect.imports import p\n"
+            "def q():\n"
+            "    return 'q(' + p() + ')'\n"))
+        system.enable_plugins(*system.plugins.values())
+        return system
+
+    # a consumer's requirements still apply to what it's plugins consume
+    system = build({"bar": "barp:<2.0.0"})
+    fresh = build({"bar": "barp:>=2.0.0"})
+    try:
+        tools.eq_(system.load("q")(), "q(foo1+bar1)")
+        delta = system.update_config({"bar": "barp:>=2.0.0"})
+        tools.eq_(
+            delta["reloaded"], ["p_plugin:1.0.0", "q_plugin:1.0.0"])
+        tools.eq_(
+            sorted(key[0] for key in delta["components"]), ["p", "q"])
+        tools.eq_(fresh.load("q")(), "q(foo1+bar2)")
+        tools.eq_(system.load("q")(), "q(foo1+bar2)")
+        tools.eq_(system.load("p")(), "foo1+bar2")
+    finally:
+        fresh.close()
+        system.close()
+
+
+def test_39_register_plugin():
+    system = pyitect.System({}, lazy_imports=True)
+    try:
+        base = types.ModuleType("memory_base")
+        base.base = lambda: "base"
+        system.register_plugin({
+            "name": "memory_base",
+            "author": "Ryex",
+            "version": "1.0.0",
+            "consumes": {},
+            "provides": {"base": ""}
+        }, module=base)
+        source = (
+            "from pyitect.imports import base\n"
+            "def derived():\n"
+            "    return base() + 'derived'\n")
+        plugin = system.register_plugin({
+            "name": "memory_derived",
+            "author": "Ryex",
+            "version": "1.0.0",
+            "consumes": {"base": "memory_base:1.0.0"},
+            "provides": {"derived": ""}
+        }, source=source)
+        tools.ok_(isinstance(plugin, pyitect.MemoryPlugin))
+        system.enable_plugins(
+            system.plugins["memory_base"], system.plugins["memory_derived"])
+        tools.eq_(system.load("derived")(), "basederived")
+        tools.ok_(system.load("base") is base.base)
+        with tools.assert_raises(pyitect.PyitectDupError):
+            system.register_plugin({
+                "name": "memory_base", "author": "Ryex",
+                "version": "1.0.0", "consumes": {}, "provides": {}
+            }, source="")
+        with tools.assert_raises(ValueError):
+            system.register_plugin({
+                "name": "memory_none", "author": "Ryex",
+                "version": "1.0.0", "consumes": {}, "provides": {}
+            })
+    finally:
+        system.close()
+    tools.ok_(plugin.get_module_name() not in sys.modules)
+
+
+def _check_preload(build, profile):
+    """Save a profile with a system from `build` and preload it"""
+    system = build()
+    try:
+        system.load("foobar")
+        system.load("sibling_greeting")
+        system.save_profile(profile)
+    finally:
+        system.close()
+
+    system = build()
+    try:
+        # the profile names a plugin this system doesn't have
+        with open(profile) as f:
+            data = json.load(f)
+        data["components"].append(["gone", "gone_plugin", "1.0.0"])
+        with open(profile, "w") as f:
+            json.dump(data, f)
+        report = system.preload(profile, workers=2)
+        tools.eq_(report["loaded"], [
+            "consume_plugin:0.0.1", "provide_plugin:1.0.0",
+            "sibling_plugin:0.0.1"])
+        tools.eq_(report["skipped"], [["gone", "gone_plugin", "1.0.0"]])
+        tools.eq_(report["errors"], [])
+        tools.eq_(len(system.components), 3)
+        tools.eq_(system.load("foobar")(), "foobar")
+    finally:
+        system.close()
+
+    # a load on another thread waits for the import preload is doing
+    # instead of running the plugin a second time
+    import threading
+    import time
+    system = pyitect.System({})
+    pyitect.preload_runs = []
+    try:
+        system.register_plugin({
+            "name": "slow_preload", "author": "Ryex", "version": "1.0.0",
+            "consumes": {}, "provides": {"slow_value": "value"}
+        }, source=(
+            "import time\n"
+            "import pyitect\n"
+            "pyitect.preload_runs.append(1)\n"
+            "time.sleep(0.2)\n"
+            "value = 1\n"))
+        system.enable_plugins(system.plugins["slow_preload"])
+        with open(profile, "w") as f:
+            json.dump({
+                "components": [["slow_value", "slow_preload", "1.0.0"]],
+                "plugins": [{"plugin": "slow_preload", "version": "1.0.0",
+                             "consumes": []}]}, f)
+
+        def load():
+            time.sleep(0.05)
+            system.load("slow_value")
+
+        thread = threading.Thread(target=load)
+        thread.start()
+        report = system.preload(profile, workers=2)
+        thread.join()
+        tools.eq_(report["errors"], [])
+        tools.eq_(pyitect.preload_runs, [1])
+        tools.eq_(system.load("slow_value"), 1)
+    finally:
+        system.close()
+        del pyitect.preload_runs
+
+
+def test_40_profile_preload():
+    global folder_path
+    plugins_path = os.path.join(folder_path, "plugins")
+    names = ("provide_plugin", "consume_plugin", "sibling_plugin")
+
+    def build():
+        system = pyitect.System({"foo": "provide_plugin:<=1.0.0"})
+        system.search(plugins_path)
+        system.enable_plugins(*[system.plugins[n] for n in names])
+        return system
+
+    profile_dir = tempfile.mkdtemp()
+    try:
+        _check_preload(build, os.path.join(profile_dir, "profile.json"))
+    finally:
+        shutil.rmtree(profile_dir)
+
+
+def test_41_iter_search():
+    global folder_path
+    plugins_path = os.path.join(folder_path, "plugins")
+    tracer = pyitect.ChromeTracer()
+    system = pyitect.System({}, tracer=tracer)
+    try:
+        found = []
+        hooked = []
+
+        def on_load(plugin, plugin_required, component_needed):
+            if plugin.startswith("on_enable_plugin:"):
+                hooked.append(len(found))
+        system.bind_event("plugin_loaded", on_load)
+        for plugin in system.iter_search(
+                plugins_path, ignore=["bad_plugin"], enable=True):
+            found.append(plugin)
+            # the walk stops at each plugin
+            tools.eq_(
+                sum(len(versions) for versions in system.plugins.values()),
+                len(found))
+            if plugin.name == "sibling_plugin":
+                # usable before the walk is done
+                tools.eq_(
+                    system.load("sibling_greeting"), "hello from a sibling")
+        tools.ok_(len(found) > 1)
+        tools.ok_("bad_plugin" not in system.plugins)
+        tools.eq_(
+            sorted(system.enabled_plugins),
+            sorted((p.name, p.version) for p in found))
+        # on_enable hooks wait for the whole walk
+        tools.eq_(hooked, [len(found)])
+    finally:
+        system.close()
+    trace = json.loads(tracer.to_json())["traceEvents"]
+    tools.ok_("iter_search" in set(event["name"] for event in trace))
+
+    # a walk stopped early leaves the hooks for flush_on_enables
+    system = pyitect.System({})
+    try:
+        walk = system.iter_search(
+            plugins_path, ignore=["bad_plugin"], enable=True)
+        for plugin in walk:
+            if plugin.name == "on_enable_plugin":
+                break
+        walk.close()
+        plugin_key = ("on_enable_plugin", pyitect.Version("0.0.1"))
+        tools.ok_(plugin_key in system.pending_on_enables)
+        system.flush_on_enables()
+        tools.ok_(plugin_key in system.loaded_plugins)
+    finally:
+        system.close()
+
+
+def _chain_system(depth, **kwargs):
+    """A system with a chain of `depth` in memory plugins, `c<n>` consuming
+    `c<n-1>`, and the plugins `cyc_a` and `cyc_b` consuming each other"""
+    system = pyitect.System({}, **kwargs)
+    for i in range(depth):
+        consumes = {}
+        source = "value = 0\n"
+        if i:
+            consumes = {"c%d" % (i - 1,): ""}
+            source = (
+                "from pyitect.imports import c%d\n"
+                "value = c%d + 1\n" % (i - 1, i - 1))
+        system.register_plugin({
+            "name": "chain%d" % (i,), "author": "Ryex",
+            "version": "1.0.0", "consumes": consumes,
+            "provides": {"c%d" % (i,): "value"}
+        }, source=source)
+    for name in ("cyc_a", "cyc_b"):
+        other = "cyc_b" if name == "cyc_a" else "cyc_a"
+        system.register_plugin({
+            "name": name, "author": "Ryex", "version": "1.0.0",
+            "consumes": {other: ""}, "provides": {name: ""}
+        }, source="from pyitect.imports import %s\n" % (other,))
+    system.enable_plugins(*system.plugins.values())
+    return system
+
+
+def _check_chains(system, depth):
+    tools.eq_(system.load("c%d" % (depth - 1,)), depth - 1)
+    with tools.assert_raises(pyitect.PyitectCycleError) as cm:
+        system.load("cyc_a")
+    tools.eq_(
+        cm.exception.cycle, ["cyc_a:1.0.0", "cyc_b:1.0.0", "cyc_a:1.0.0"])
+    # reported as it is, not wrapped by every load it went through
+    tools.ok_(cm.exception.cause is None)
+    tools.ok_(("cyc_a", pyitect.Version("1.0.0"))
+              not in system.loaded_plugins)
+    tools.ok_(("cyc_b", pyitect.Version("1.0.0"))
+              not in system.loaded_plugins)
+
+
+def test_42_deep_and_cyclic_chains():
+    # a chain far deeper than the recursion limit allows nested loads
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    system = None
+    try:
+        system = _chain_system(400)
+        _check_chains(system, 400)
+    finally:
+        sys.setrecursionlimit(limit)
+        if system is not None:
+            system.close()
+
+
+def test_43_deep_and_cyclic_lazy_chains():
+    # lazy imports nest loads inside imports, only so many of them
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(400)
+    system = None
+    try:
+        system = _chain_system(400, lazy_imports=True)
+        _check_chains(system, 400)
+    finally:
+        sys.setrecursionlimit(limit)
+        if system is not None:
+            system.close()
+
+
+def test_44_deep_and_cyclic_hosted_chains():
+    # planning a hosted load walks the chain without recursing too
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    system = None
+    try:
+        system = _chain_system(400)
+        system.host_plugins(["chain399", "cyc_a"], processes=1)
+        tools.ok_(isinstance(system.load("c399"), pyitect.RemoteComponent))
+        with tools.assert_raises(pyitect.PyitectCycleError) as cm:
+            system.load("cyc_a")
+        tools.eq_(cm.exception.cycle,
+                  ["cyc_a:1.0.0", "cyc_b:1.0.0", "cyc_a:1.0.0"])
+    finally:
+        sys.setrecursionlimit(limit)
+        if system is not None:
+            system.close()
+
+
 if __name__ == "__main__":
     setup()
     tests = []